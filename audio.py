@@ -0,0 +1,284 @@
+# audio.py
+
+import bisect
+import shutil
+import subprocess
+import threading
+import numpy as np
+
+def get_ffmpeg_exe() -> str:
+    """优先使用 imageio-ffmpeg 自带的 ffmpeg，其次使用 PATH 中的 ffmpeg。"""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        exe = shutil.which('ffmpeg')
+        if not exe:
+            raise RuntimeError("未找到 ffmpeg，请安装 ffmpeg 或 imageio-ffmpeg。")
+        return exe
+
+def _open_ffmpeg_pipe(path: str, sample_rate: int, channels: int) -> subprocess.Popen:
+    # 解码、重采样与声道混合全部交给 ffmpeg，直接输出 float32 小端 PCM
+    cmd = [
+        get_ffmpeg_exe(), '-nostdin', '-v', 'error',
+        '-i', str(path),
+        '-vn', '-map', '0:a:0',
+        '-f', 'f32le', '-acodec', 'pcm_f32le',
+        '-ac', str(channels), '-ar', str(sample_rate),
+        '-',
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # 损坏的输入会让 ffmpeg 持续输出逐包错误；stderr 必须并行读取，否则管道写满后 ffmpeg 阻塞、读取 stdout 的一方也永远等待
+    proc.stderr_tail = bytearray()
+    proc.stderr_thread = threading.Thread(target=_drain_stderr, args=(proc,), name='ffmpeg-stderr', daemon=True)
+    proc.stderr_thread.start()
+    return proc
+
+def _drain_stderr(proc: subprocess.Popen, keep_bytes: int = 64 * 1024):
+    """读完 ffmpeg 的 stderr，只保留最后 keep_bytes 字节用于报错。"""
+    for line in iter(proc.stderr.readline, b''):
+        proc.stderr_tail += line
+        if len(proc.stderr_tail) > keep_bytes:
+            del proc.stderr_tail[:-keep_bytes]
+
+def _check_ffmpeg_exit(proc: subprocess.Popen):
+    returncode = proc.wait()
+    proc.stderr_thread.join()
+    stderr = proc.stderr_tail.decode('utf-8', errors='replace')
+    if returncode != 0:
+        if 'matches no streams' in stderr or 'does not contain any stream' in stderr:
+            raise ValueError("视频文件不含音频。")
+        # 只报告最后几行，损坏文件的逐包错误可能有上千行
+        tail = "\n".join(stderr.strip().splitlines()[-20:])
+        raise RuntimeError(f"ffmpeg 解码音频失败: {tail}")
+
+def iter_audio_chunks(path: str, sample_rate: int, channels: int, chunk_seconds: float = 30.0):
+    """
+    通过 ffmpeg 管道按固定长度流式解码音频，不生成临时 WAV 文件。
+    每次产出形状为 (channels, samples) 的 float32 数组，最后一块可能较短。
+    """
+    frame_bytes = 4 * channels
+    chunk_bytes = max(1, int(chunk_seconds * sample_rate)) * frame_bytes
+    proc = _open_ffmpeg_pipe(path, sample_rate, channels)
+    try:
+        pending = b''
+        while True:
+            data = proc.stdout.read(chunk_bytes - len(pending))
+            if not data:
+                break
+            pending += data
+            if len(pending) < chunk_bytes:
+                continue
+            yield np.frombuffer(pending, dtype=np.float32).reshape(-1, channels).T.copy()
+            pending = b''
+        usable = len(pending) - len(pending) % frame_bytes
+        if usable:
+            yield np.frombuffer(pending[:usable], dtype=np.float32).reshape(-1, channels).T.copy()
+        _check_ffmpeg_exit(proc)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+def load_audio(path: str, sample_rate: int, channels: int) -> np.ndarray:
+    """
+    一次性解码整条音轨到内存，返回形状为 (channels, samples) 的 float32 数组。
+    数据直接读入一个可写缓冲区，不经过磁盘，也没有额外的重采样拷贝。
+    """
+    proc = _open_ffmpeg_pipe(path, sample_rate, channels)
+    try:
+        buf = bytearray()
+        while True:
+            data = proc.stdout.read(1024 * 1024 * 4)
+            if not data: break
+            buf += data
+        _check_ffmpeg_exit(proc)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+    usable = len(buf) - len(buf) % (4 * channels)
+    del buf[usable:]
+    # frombuffer 不复制数据；转置后为 (channels, samples) 视图
+    return np.frombuffer(buf, dtype=np.float32).reshape(-1, channels).T
+
+# Pyannote 与 Whisper 内部都以 16 kHz 单声道处理音频
+MODEL_SAMPLE_RATE = 16000
+
+class AudioBuffer:
+    """
+    16 kHz 单声道 float32 音频，解码一次后同时交给 Pyannote 与 Whisper。
+    两者拿到的都是同一块内存上的视图，不再各自读文件、重采样。使用方不得原地修改数据。
+    """
+    sample_rate = MODEL_SAMPLE_RATE
+
+    def __init__(self, samples: np.ndarray):
+        self.samples = np.ascontiguousarray(samples, dtype=np.float32).reshape(-1)
+
+    @classmethod
+    def from_file(cls, path) -> 'AudioBuffer':
+        return cls(load_audio(str(path), MODEL_SAMPLE_RATE, 1)[0])
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    def numpy(self) -> np.ndarray:
+        """Whisper 的 transcribe 直接接受 16 kHz float32 数组，不再调用 ffmpeg。"""
+        return self.samples
+
+    def waveform(self) -> dict:
+        """Pyannote 的内存输入格式 {'waveform': (channel, time) 张量, 'sample_rate': ...}，与 NumPy 数组共享内存。"""
+        import torch
+        return {'waveform': torch.from_numpy(self.samples).unsqueeze(0), 'sample_rate': self.sample_rate}
+
+# --- 背景声估计 ---
+def estimate_background(chunks, sample_rate: int, frame_ms: float = 64.0, max_frames: int = 4000,
+                        low_cut: float = 80.0, seed: int = 0) -> dict:
+    """
+    不做分离，粗略估计混音中非人声 (音乐、环境声) 的比重，用于判断能否跳过 Demucs。
+    chunks 为 iter_audio_chunks 产出的单声道块 (或单个数组组成的列表)。
+
+    - floor_db: 最安静 10% 帧相对最响 10% 帧的电平差。干净的人声在停顿处接近静音 (约 -40 dB 以下)，
+      有背景音乐时停顿处仍有声音，差值会明显变小。
+    - low_ratio: low_cut 以下的低频能量占比；贝斯、底鼓等伴奏会抬高它，人声基频基本都在其上。
+    - duration: 音频总时长 (秒)。
+    用蓄水池抽样保留至多 max_frames 帧，边解码边统计，内存占用和耗时都不随时长增长。
+    """
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    rng = np.random.default_rng(seed)
+    reservoir = np.empty((max_frames, frame), dtype=np.float32)
+    seen, total, pending = 0, 0, np.empty(0, dtype=np.float32)
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        total += len(chunk)
+        data = np.concatenate((pending, chunk)) if len(pending) else chunk
+        n = len(data) // frame
+        pending = data[n * frame:].copy()
+        if n == 0: continue
+        frames = data[:n * frame].reshape(n, frame)
+        idx = np.arange(seen, seen + n)
+        fill = idx < max_frames
+        reservoir[idx[fill]] = frames[fill]
+        # 第 i 帧 (i >= max_frames) 以 max_frames / (i + 1) 的概率替换随机一格；重复下标按顺序以后者为准
+        rest = np.flatnonzero(~fill)
+        if len(rest):
+            slots = (rng.random(len(rest)) * (idx[rest] + 1)).astype(np.int64)
+            hit = slots < max_frames
+            reservoir[slots[hit]] = frames[rest[hit]]
+        seen += n
+    stats = _background_stats(reservoir[:min(seen, max_frames)], sample_rate, low_cut) if seen \
+        else {'floor_db': 0.0, 'low_ratio': 0.0}
+    return {**stats, 'duration': total / sample_rate}
+
+def _background_stats(frames: np.ndarray, sample_rate: int, low_cut: float) -> dict:
+    frame = frames.shape[1]
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    floor_db = float(np.percentile(energy_db, 10) - np.percentile(energy_db, 90))
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(frame).astype(np.float32), axis=1)) ** 2
+    freqs = np.fft.rfftfreq(frame, 1.0 / sample_rate)
+    total = float(spectrum.sum())
+    low_ratio = float(spectrum[:, freqs < low_cut].sum() / total) if total > 0 else 0.0
+    return {'floor_db': round(floor_db, 2), 'low_ratio': round(low_ratio, 4)}
+
+# --- 语音活动检测 (VAD) ---
+def detect_speech_regions(wave: np.ndarray, sample_rate: int, frame_ms: float = 30.0, margin_db: float = 10.0,
+                          floor_db: float = -55.0, min_speech: float = 0.25, min_silence: float = 0.6,
+                          pad: float = 0.25) -> list:
+    """
+    基于能量的语音活动检测，全部使用 NumPy 向量化计算。
+
+    以 10% 分位的帧能量作为噪声底，高于 噪声底 + margin_db (且高于 floor_db) 的帧视为语音；
+    短于 min_silence 的静音会被并入语音，短于 min_speech 的语音会被丢弃，最后两侧各扩展 pad 秒。
+    返回按时间排序、互不重叠的 (start, end) 秒数列表。
+    """
+    wave = np.asarray(wave, dtype=np.float32).reshape(-1)
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = len(wave) // frame
+    if n_frames == 0:
+        return []
+    frames = wave[:n_frames * frame].reshape(n_frames, frame)
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    threshold = max(np.percentile(energy_db, 10) + margin_db, floor_db)
+    voiced = energy_db > threshold
+    if not voiced.any():
+        return []
+
+    # 用差分找出连续语音段的起止帧
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    frame_seconds = frame / sample_rate
+
+    # 合并间隔过短的静音
+    gaps = (starts[1:] - ends[:-1]) * frame_seconds
+    keep = np.concatenate(([True], gaps >= min_silence))
+    starts = starts[keep]
+    ends = np.concatenate((ends[:-1][keep[1:]], ends[-1:]))
+    # 丢弃过短的语音
+    long_enough = (ends - starts) * frame_seconds >= min_speech
+    starts, ends = starts[long_enough], ends[long_enough]
+
+    duration = len(wave) / sample_rate
+    regions = []
+    for s, e in zip(starts * frame_seconds - pad, ends * frame_seconds + pad):
+        s, e = max(0.0, float(s)), min(duration, float(e))
+        if regions and s <= regions[-1][1]:
+            regions[-1][1] = max(regions[-1][1], e)
+        else:
+            regions.append([s, e])
+    return [(s, e) for s, e in regions]
+
+def compact_audio(wave: np.ndarray, sample_rate: int, regions: list) -> np.ndarray:
+    """只保留语音区间，拼接成一段更短的音频。"""
+    wave = np.asarray(wave).reshape(-1)
+    pieces = [wave[int(s * sample_rate):int(e * sample_rate)] for s, e in regions]
+    return np.concatenate(pieces) if pieces else wave[:0]
+
+
+class TimeMap:
+    """
+    压缩后时间轴与原始时间轴之间的映射。regions 为原始时间轴上保留下来的 (start, end) 区间，
+    它们在压缩音频中首尾相接。
+    """
+    def __init__(self, regions: list):
+        self.orig_starts = [s for s, _ in regions]
+        self.orig_ends = [e for _, e in regions]
+        self.comp_starts = []
+        t = 0.0
+        for s, e in regions:
+            self.comp_starts.append(t)
+            t += e - s
+        self.compact_duration = t
+
+    def to_original(self, t: float, is_end: bool = False) -> float:
+        """is_end 为 True 时，恰好落在拼接点上的时间归属前一个区间的末尾。"""
+        if not self.comp_starts:
+            return t
+        k = (bisect.bisect_left if is_end else bisect.bisect_right)(self.comp_starts, t) - 1
+        k = max(0, k)
+        return min(self.orig_starts[k] + max(0.0, t - self.comp_starts[k]), self.orig_ends[k])
+
+    def map_segments(self, segments: list) -> list:
+        """原地改写 Whisper 片段 (及其逐词时间戳) 的起止时间。"""
+        for seg in segments:
+            for item in [seg, *(seg.get('words') or [])]:
+                if item.get('start') is not None:
+                    item['start'] = self.to_original(item['start'])
+                if item.get('end') is not None:
+                    item['end'] = self.to_original(item['end'], is_end=True)
+        return segments
+
+    def map_turns(self, turns: list) -> list:
+        """把压缩时间轴上的说话人轮次映射回原始时间轴；跨越拼接点的轮次会被拆开。"""
+        mapped = []
+        for start, end, speaker in turns:
+            k = max(0, bisect.bisect_right(self.comp_starts, start) - 1)
+            while k < len(self.comp_starts) and self.comp_starts[k] < end:
+                region_len = self.orig_ends[k] - self.orig_starts[k]
+                s = max(start, self.comp_starts[k]) - self.comp_starts[k]
+                e = min(end, self.comp_starts[k] + region_len) - self.comp_starts[k]
+                if e > s:
+                    mapped.append((self.orig_starts[k] + s, self.orig_starts[k] + e, speaker))
+                k += 1
+        return mapped
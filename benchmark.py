@@ -0,0 +1,429 @@
+# benchmark.py
+"""
+离线、可复现的性能基准测试。
+
+生成指定时长与说话人数的合成音频/视频，用桩模型 (不需要网络和 GPU) 跑完整的
+SubtitleGenerator.run，并分别计时 assign_speaker_to_whisper_segments、
+由片段构造字幕存储、按说话人分块、改名与 SRT 导出。结果写入 JSON 文件，
+可与之前保存的基线比较，超过阈值的项目会被标记为回归并以非零状态退出。
+
+用法:
+    python benchmark.py --duration 600 --speakers 3 --output bench.json
+    python benchmark.py --duration 600 --speakers 3 --compare baseline.json --threshold 0.15
+    python benchmark.py --real-models   # 使用 config.json 中配置的真实模型
+    python benchmark.py --cpu-quantization --cpu-threads 4   # CPU 上对比 fp32 与动态 int8 量化的推理耗时
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+import re
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+ROOT = Path(__file__).resolve().parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from audio import get_ffmpeg_exe
+from config import PIPELINE_PROFILES, DEFAULT_PROFILE
+
+FIXTURE_SAMPLE_RATE = 16000
+
+# --- 合成数据 ---
+def make_turns(duration: float, speakers: int, seed: int = 0) -> list:
+    """生成说话人轮次：每段 2~8 秒，轮次之间有 0.2~1.5 秒的静音。"""
+    rng = random.Random(seed)
+    turns, t, speaker = [], 0.5, 0
+    while t < duration - 1.0:
+        length = min(rng.uniform(2.0, 8.0), duration - t)
+        turns.append((round(t, 3), round(t + length, 3), f"SPEAKER_{speaker:02d}"))
+        t += length + rng.uniform(0.2, 1.5)
+        speaker = (speaker + rng.randint(1, max(1, speakers - 1))) % speakers if speakers > 1 else 0
+    return turns
+
+def make_audio_fixture(path, duration: float, speakers: int, seed: int = 0) -> list:
+    """写出合成人声 WAV：每个说话人使用不同基频的谐波音，并带有音节状的幅度调制。"""
+    rng = np.random.default_rng(seed)
+    sr = FIXTURE_SAMPLE_RATE
+    audio = (rng.standard_normal(int(duration * sr)).astype(np.float32) * 0.002)
+    turns = make_turns(duration, speakers, seed)
+    for start, end, speaker in turns:
+        f0 = 110.0 + 35.0 * int(speaker.split('_')[1])
+        s, e = int(start * sr), int(end * sr)
+        t = np.arange(e - s, dtype=np.float32) / sr
+        voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4.0 * t) ** 2
+        audio[s:e] += (0.2 * voice * envelope).astype(np.float32)
+    sf.write(str(path), audio, sr)
+    return turns
+
+def make_video_fixture(audio_path, video_path, duration: float):
+    """用 ffmpeg 生成一个黑屏视频并混入合成音轨，全程离线。"""
+    cmd = [
+        get_ffmpeg_exe(), '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'color=c=black:s=160x90:r=5:d={duration}',
+        '-i', str(audio_path),
+        '-shortest', '-c:v', 'mpeg4', '-c:a', 'aac',
+        str(video_path),
+    ]
+    subprocess.run(cmd, check=True)
+
+def make_whisper_segments(duration: float, seg_seconds: float = 4.0) -> list:
+    segments, t, i = [], 0.0, 0
+    while t < duration:
+        end = min(t + seg_seconds, duration)
+        segments.append({'id': i, 'start': t, 'end': end, 'text': f"这是第 {i} 句测试字幕 segment {i}"})
+        t, i = end, i + 1
+    return segments
+
+# --- 桩模型 ---
+def _audio_duration(audio) -> float:
+    if isinstance(audio, dict):
+        return audio['waveform'].shape[-1] / audio['sample_rate']
+    if isinstance(audio, (str, Path)):
+        return sf.info(str(audio)).duration
+    return audio.shape[-1] / FIXTURE_SAMPLE_RATE
+
+class StubWhisper:
+    """按固定长度切分音频并返回确定性文本，接口与 whisper 模型的 transcribe 一致。"""
+    def transcribe(self, audio, language=None, **kwargs):
+        segments = make_whisper_segments(_audio_duration(audio))
+        return {'text': " ".join(s['text'] for s in segments), 'segments': segments, 'language': language or 'zh'}
+
+class StubDiarization:
+    """每 5 秒轮换一次说话人，返回 (start, end, speaker) 列表。"""
+    def __call__(self, audio, num_speakers=None, **kwargs):
+        duration = _audio_duration(audio)
+        n = num_speakers or 2
+        return [(t, min(t + 5.0, duration), f"SPEAKER_{int(t // 5) % n:02d}") for t in np.arange(0.0, duration, 5.0)]
+
+def make_stub_demucs():
+    import torch
+
+    class StubDemucs(torch.nn.Module):
+        """与 htdemucs 接口一致的桩模型：四个音源直接按比例复制输入。"""
+        samplerate = 44100
+        audio_channels = 2
+        sources = ['drums', 'bass', 'other', 'vocals']
+        segment = 7.8
+
+        def __init__(self):
+            super().__init__()
+            self.register_buffer('gains', torch.tensor([0.1, 0.1, 0.1, 0.7]))
+
+        def forward(self, mix):
+            return mix.unsqueeze(1) * self.gains.view(1, -1, 1, 1)
+
+    return StubDemucs()
+
+def install_stub_models(generator):
+    """按生成器当前的档位、后端与精度 (含 CPU 量化设置) 把注册表中的模型换成桩模型。"""
+    from models import registry
+    from get_subtitle import DEMUCS_MODEL_NAME, DIARIZATION_PIPELINE_NAME
+    device = generator.device
+    registry.register('demucs', DEMUCS_MODEL_NAME, device, make_stub_demucs(), dtype=generator._demucs_dtype())
+    backend, dtype = generator._asr_settings()
+    registry.register(backend, generator.whisper_model_name, device, StubWhisper(), dtype=dtype)
+    registry.register('diarization', DIARIZATION_PIPELINE_NAME, device, StubDiarization())
+
+# --- 计时 ---
+def timeit(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {'best': min(samples), 'mean': statistics.mean(samples), 'repeat': repeat, 'unit': 's'}
+
+def bench_pipeline(video_path, workdir: Path, args) -> dict:
+    from config import get_config
+    from get_subtitle import SubtitleGenerator
+
+    config = dict(get_config()) if args.real_models else {'model_name': 'bench-stub', 'hf_token': 'offline'}
+    config.update({
+        'use_deepseek': False,
+        'artifact_cache_dir': str(workdir / 'artifacts'),
+        'metrics_path': str(workdir / 'metrics.jsonl'),
+        'demucs_chunk_seconds': args.demucs_chunk_seconds,
+        'pipeline_profile': args.profile,
+    })
+    generator = SubtitleGenerator(config)
+    if not args.real_models:
+        install_stub_models(generator)
+
+    results = {}
+    for label in ('cold', 'warm'):
+        # 冷启动使用空缓存，热启动复用前一次运行的中间产物
+        before = sum(1 for _ in open(config['metrics_path'], encoding='utf-8')) if Path(config['metrics_path']).exists() else 0
+        start = time.perf_counter()
+        generator.run(str(video_path), language='zh', num_speakers=args.speakers, job_id=f"bench-{label}")
+        results[f'pipeline.{label}.total'] = {'best': time.perf_counter() - start, 'repeat': 1, 'unit': 's'}
+        with open(config['metrics_path'], encoding='utf-8') as f:
+            records = [json.loads(line) for line in f][before:]
+        for rec in records:
+            if rec['stage'] == 'total': continue
+            entry = {'best': rec['wall_seconds'], 'repeat': 1, 'unit': 's', 'cached': rec.get('cached', False)}
+            if rec.get('rtf') is not None: entry['rtf'] = rec['rtf']
+            results[f"pipeline.{label}.{rec['stage']}"] = entry
+    return results
+
+def bench_editor_paths(duration: float, speakers: int, workdir: Path, repeat: int) -> dict:
+    from get_subtitle import assign_speaker_to_whisper_segments, to_public_segment
+    from export import to_srt
+    from utils import SubtitleStore
+
+    turns = make_turns(duration, speakers)
+    segments = make_whisper_segments(duration, seg_seconds=2.5)
+    results = {}
+    results['assign_speaker_to_whisper_segments'] = timeit(
+        lambda: assign_speaker_to_whisper_segments(turns, [dict(s) for s in segments]), repeat)
+    assigned = assign_speaker_to_whisper_segments(turns, [dict(s) for s in segments])
+    public = [to_public_segment(s) for s in assigned]
+    def build_store():
+        store = SubtitleStore()
+        store.extend(public)
+        return store
+    results['segments_to_store'] = timeit(build_store, repeat)
+    results['export_srt'] = timeit(lambda: to_srt(public), repeat)
+    store = build_store()
+    results['speaker_runs'] = timeit(store.speaker_runs, repeat)
+    results['store_to_segments'] = timeit(store.to_segments, repeat)
+    results['rename_speaker'] = timeit(lambda: (store.rename_speaker('SPEAKER_00', 'A'), store.rename_speaker('A', 'SPEAKER_00')), repeat)
+    for entry in results.values():
+        entry['items'] = len(segments)
+    return results
+
+# --- 语音识别后端对比 ---
+_CER_NORMALIZE_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+def char_error_rate(reference: str, hypothesis: str) -> float:
+    """忽略空白与标点的字错误率 (编辑距离 / 参考长度)。逐行动态规划，行内用 NumPy 向量化。"""
+    ref = _CER_NORMALIZE_RE.sub("", reference or "").lower()
+    hyp = _CER_NORMALIZE_RE.sub("", hypothesis or "").lower()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    hyp_codes = np.frombuffer(hyp.encode('utf-32-le'), dtype=np.uint32)
+    cols = np.arange(len(hyp) + 1)
+    prev = cols.copy()
+    for i, ch in enumerate(ref, start=1):
+        substitute = prev[:-1] + (hyp_codes != ord(ch))
+        row = np.concatenate(([i], np.minimum(prev[1:] + 1, substitute)))
+        # 行内插入: row[j] = min(row[k] + (j - k))，等价于对 row - j 做前缀最小值
+        prev = np.minimum.accumulate(row - cols) + cols
+    return float(prev[-1]) / len(ref)
+
+def bench_asr_backends(audio_path: Path, backends: list, model_name: str, language: str = None,
+                       reference: str = None) -> dict:
+    """
+    用同一段真实语音依次运行各语音识别后端，记录加载耗时、转录耗时与实时率。
+    给出参考文本时计算各后端的字错误率，否则以第一个后端的结果为参考计算一致性。
+    """
+    import torch
+    from asr import create_backend
+    from audio import AudioBuffer
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    audio = AudioBuffer.from_file(audio_path)
+    results, texts = {}, {}
+    for backend in backends:
+        # 'openai-whisper:qint8' 这样的写法指定推理精度，可对比量化前后的字错误率
+        name = f"asr.{backend}"
+        kind, _, dtype = backend.partition(':')
+        try:
+            start = time.perf_counter()
+            model = create_backend(kind, model_name, device, dtype=dtype or None, cpu_threads=torch.get_num_threads())
+            load_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            result = model.transcribe(audio.numpy(), language=language)
+            seconds = time.perf_counter() - start
+        except Exception as e:
+            print(f"{backend} 运行失败: {e}")
+            continue
+        texts[backend] = result['text']
+        results[name] = {'best': seconds, 'repeat': 1, 'unit': 's', 'load_seconds': round(load_seconds, 3),
+                         'rtf': round(audio.duration / seconds, 3) if seconds > 0 else None,
+                         'segments': len(result['segments'])}
+        del model
+    if texts:
+        ref_text = reference if reference is not None else texts[next(iter(texts))]
+        for backend, text in texts.items():
+            results[f"asr.{backend}"]['cer'] = round(char_error_rate(ref_text, text), 4)
+            results[f"asr.{backend}"]['cer_reference'] = 'reference' if reference is not None else next(iter(texts))
+            print(f"{backend}: 耗时 {results[f'asr.{backend}']['best']:.2f} s，"
+                  f"实时率 {results[f'asr.{backend}']['rtf']}，字错误率 {results[f'asr.{backend}']['cer']}")
+    return results
+
+# --- CPU 量化 ---
+def _snr_db(reference, estimate) -> float:
+    noise = float(((estimate - reference) ** 2).mean())
+    return round(10.0 * np.log10(float((reference ** 2).mean()) / noise), 2) if noise > 0 else float('inf')
+
+def bench_cpu_quantization(audio_path: Path, repeat: int) -> dict:
+    """
+    在 CPU 上对比 fp32 与 Linear 层动态 int8 量化后的推理耗时，并给出量化输出相对 fp32 的信噪比。
+    模型使用随机初始化的权重 (结构与 htdemucs、Whisper base 相同)，无需下载，只用于衡量速度，
+    信噪比只能发现量化后输出明显出错的情况；真实权重下的识别准确率用
+    --asr-backends openai-whisper,openai-whisper:qint8 对比。
+    """
+    import torch
+    from cpu_tuning import quantize_linear_int8
+    torch.manual_seed(0)
+    results = {}
+
+    def run(label: str, model, forward):
+        quantized = quantize_linear_int8(model)
+        with torch.inference_mode():
+            reference, estimate = forward(model), forward(quantized)
+            fp32 = timeit(lambda: forward(model), repeat)
+            qint8 = timeit(lambda: forward(quantized), repeat)
+        qint8['speedup'] = round(fp32['best'] / qint8['best'], 3)
+        qint8['snr_db'] = _snr_db(reference.numpy(), estimate.numpy())
+        results[f'cpu.{label}.fp32'] = fp32
+        results[f'cpu.{label}.qint8'] = qint8
+        print(f"{label}: fp32 {fp32['best']:.3f} s，qint8 {qint8['best']:.3f} s "
+              f"(加速 {qint8['speedup']}x，信噪比 {qint8['snr_db']} dB)")
+
+    from demucs.htdemucs import HTDemucs
+    demucs = HTDemucs(sources=['drums', 'bass', 'other', 'vocals']).eval()
+    wave, sr = sf.read(str(audio_path), dtype='float32')
+    # 取一个 Demucs 训练片段长度的立体声窗口，重采样误差不影响计时
+    segment = int(float(demucs.segment) * demucs.samplerate)
+    mix = np.resize(np.interp(np.arange(segment) * sr / demucs.samplerate, np.arange(len(wave)), wave), segment)
+    mix = torch.from_numpy(np.stack([mix, mix]).astype(np.float32)).unsqueeze(0)
+    run('demucs', demucs, lambda m: m(mix))
+
+    try:
+        import whisper
+        from whisper.model import ModelDimensions, Whisper
+    except ImportError:
+        print("未安装 openai-whisper，跳过 Whisper 量化基准。")
+        return results
+    dims = ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=512, n_audio_head=8, n_audio_layer=6,
+                           n_vocab=51865, n_text_ctx=448, n_text_state=512, n_text_head=8, n_text_layer=6)
+    model = Whisper(dims).eval()
+    mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(wave)))
+    tokens = torch.arange(64).unsqueeze(0)
+    # 编码一个 30 秒窗口并对 64 个 token 做一次解码器前向
+    run('whisper', model, lambda m: m.logits(tokens, m.embed_audio(mel.unsqueeze(0))))
+    return results
+
+# --- 结果比较 ---
+def compare(current: dict, baseline: dict, threshold: float, min_seconds: float = 0.001) -> list:
+    """
+    返回回归项列表 (名称, 基线, 当前, 比值)。只比较两边都存在且未命中缓存的项目；
+    基线耗时低于 min_seconds 的项目计时噪声过大，只显示不判定。
+    """
+    regressions = []
+    print(f"\n{'项目':<45}{'基线(s)':>12}{'当前(s)':>12}{'比值':>8}")
+    for name, cur in sorted(current['results'].items()):
+        base = baseline.get('results', {}).get(name)
+        if not base or not base.get('best'):
+            continue
+        ratio = cur['best'] / base['best']
+        flag = ''
+        if ratio > 1.0 + threshold and not cur.get('cached') and base['best'] >= min_seconds:
+            flag = '  <-- 回归'
+            regressions.append((name, base['best'], cur['best'], ratio))
+        print(f"{name:<45}{base['best']:>12.4f}{cur['best']:>12.4f}{ratio:>8.2f}{flag}")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="字幕流水线与编辑器数据路径的离线基准测试")
+    parser.add_argument('--duration', type=float, default=300.0, help="合成音频时长 (秒)")
+    parser.add_argument('--speakers', type=int, default=3, help="合成说话人数")
+    parser.add_argument('--repeat', type=int, default=5, help="微基准的重复次数 (取最好成绩)")
+    parser.add_argument('--demucs-chunk-seconds', type=float, default=60.0)
+    parser.add_argument('--profile', default=DEFAULT_PROFILE, choices=sorted(PIPELINE_PROFILES), help="处理档位")
+    parser.add_argument('--skip-pipeline', action='store_true', help="只运行编辑器数据路径的微基准")
+    parser.add_argument('--real-models', action='store_true', help="使用 config.json 中的真实模型而非桩模型")
+    parser.add_argument('--asr-backends', help="逗号分隔的语音识别后端，如 openai-whisper,faster-whisper；给出时对比各后端")
+    parser.add_argument('--asr-audio', help="后端对比使用的真实语音文件 (合成音频不含可识别的语音)")
+    parser.add_argument('--asr-reference', help="后端对比的参考文本文件，用于计算字错误率")
+    parser.add_argument('--asr-model', default='small', help="后端对比使用的 Whisper 模型")
+    parser.add_argument('--asr-language', help="后端对比的语言代码，默认自动检测")
+    parser.add_argument('--cpu-quantization', action='store_true', help="在 CPU 上对比 fp32 与动态 int8 量化的推理耗时")
+    parser.add_argument('--cpu-threads', type=int, default=0, help="torch 线程数 (同 cpu_threads_per_job)，0 为全部可用核心")
+    parser.add_argument('--cpu-interop-threads', type=int, default=1, help="torch inter-op 线程数 (同 cpu_interop_threads)，0 为 torch 默认值")
+    parser.add_argument('--cpu-affinity', default='', help="绑定的核心，如 0-3 (同 cpu_affinity)")
+    parser.add_argument('--output', default='bench_output.json', help="结果文件路径")
+    parser.add_argument('--compare', help="与之比较的基线结果文件")
+    parser.add_argument('--threshold', type=float, default=0.15, help="判定回归的相对变慢比例")
+    parser.add_argument('--min-seconds', type=float, default=0.001, help="低于此耗时的项目不参与回归判定")
+    args = parser.parse_args(argv)
+    if args.asr_backends and not args.asr_audio:
+        parser.error("--asr-backends 需要同时指定 --asr-audio")
+    asr_audio = Path(args.asr_audio).resolve() if args.asr_audio else None
+    asr_reference = Path(args.asr_reference).read_text(encoding='utf-8') if args.asr_reference else None
+    # 必须在任何 torch 运算之前设置，与工作进程启动时的做法一致
+    from cpu_tuning import apply_cpu_limits
+    cpu_limits = apply_cpu_limits({'cpu_threads_per_job': args.cpu_threads, 'cpu_interop_threads': args.cpu_interop_threads,
+                                   'cpu_affinity': args.cpu_affinity})
+
+    output_path = Path(args.output).resolve()
+    baseline_path = Path(args.compare).resolve() if args.compare else None
+    cwd = os.getcwd()
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='subtitle-bench-') as tmp:
+        workdir = Path(tmp)
+        # SubtitleGenerator.run 把输出写到相对路径 demucs_output 下，切换到临时目录避免污染仓库
+        os.chdir(workdir)
+        try:
+            print(f"生成 {args.duration:g} 秒、{args.speakers} 个说话人的合成数据...")
+            audio_path = workdir / 'fixture.wav'
+            make_audio_fixture(audio_path, args.duration, args.speakers)
+            if not args.skip_pipeline:
+                video_path = workdir / 'fixture.mp4'
+                make_video_fixture(audio_path, video_path, args.duration)
+                results.update(bench_pipeline(video_path, workdir, args))
+            results.update(bench_editor_paths(args.duration, args.speakers, workdir, args.repeat))
+            if args.asr_backends:
+                results.update(bench_asr_backends(asr_audio, [b.strip() for b in args.asr_backends.split(',') if b.strip()],
+                                                  args.asr_model, args.asr_language, asr_reference))
+            if args.cpu_quantization:
+                results.update(bench_cpu_quantization(audio_path, args.repeat))
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'duration': args.duration,
+            'speakers': args.speakers,
+            'stub_models': not args.real_models,
+            'profile': args.profile,
+            'cpu_limits': cpu_limits,
+        },
+        'results': results,
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    for name, entry in sorted(results.items()):
+        print(f"{name:<45}{entry['best']:>12.4f} s")
+    print(f"结果已写入 {output_path}")
+
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('duration') != args.duration:
+            print("警告: 基线与本次运行的合成时长不同，比较结果仅供参考。")
+        regressions = compare(report, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项性能回归 (阈值 {args.threshold:.0%})。")
+            return 1
+        print("\n未发现性能回归。")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
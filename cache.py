@@ -0,0 +1,148 @@
+# cache.py
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+
+class ArtifactCache:
+    """
+    基于内容寻址的磁盘缓存，用于保存字幕流水线各阶段的中间产物
+    (Demucs 人声、说话人分离结果、转录结果等)。
+
+    每个条目的键由输入文件哈希和阶段参数共同决定，存放在 root/<键前两位>/<键>/ 目录下。
+    条目目录的修改时间作为最近访问时间，超过容量上限时按 LRU 顺序淘汰。
+    """
+    HASH_CHUNK_SIZE = 1024 * 1024 * 4
+
+    def __init__(self, root, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._digest_memo = {}
+        # 缓存总大小，首次淘汰检查时扫描目录得到，之后随写入累加
+        self._total_bytes = None
+
+    def file_digest(self, path) -> str:
+        """计算文件的 SHA-256。同一进程内按 (路径, 大小, 修改时间) 记忆，避免重复读取大文件。"""
+        path = Path(path)
+        st = path.stat()
+        memo_key = (str(path.resolve()), st.st_size, st.st_mtime_ns)
+        if memo_key in self._digest_memo:
+            return self._digest_memo[memo_key]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(self.HASH_CHUNK_SIZE)
+                if not chunk: break
+                h.update(chunk)
+        digest = h.hexdigest()
+        self._digest_memo[memo_key] = digest
+        return digest
+
+    @staticmethod
+    def make_key(stage: str, **params) -> str:
+        payload = json.dumps({'stage': stage, **params}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get_path(self, key: str, filename: str):
+        """命中时返回产物路径并刷新其访问时间，否则返回 None。"""
+        artifact = self._entry_dir(key) / filename
+        if not artifact.exists():
+            return None
+        now = time.time()
+        try:
+            os.utime(self._entry_dir(key), (now, now))
+        except OSError:
+            pass
+        return artifact
+
+    def put_file(self, key: str, src_path, filename: str) -> Path:
+        """
+        将 src_path 移动到缓存中 (同一文件系统下为重命名)，返回缓存内的路径。
+        键由内容决定，其他进程已写入同一条目时直接使用已有的条目，丢弃本次的文件。
+        """
+        entry = self._entry_dir(key)
+        artifact = entry / filename
+        tmp_entry = entry.with_name(f"{entry.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        tmp_entry.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(src_path), str(tmp_entry / filename))
+        size = (tmp_entry / filename).stat().st_size
+        with self._lock:
+            if entry.exists() and not artifact.exists():
+                # 残缺的旧条目 (例如写入时进程被杀)，直接替换
+                shutil.rmtree(entry, ignore_errors=True)
+            try:
+                os.replace(tmp_entry, entry)
+                inserted = True
+            except OSError:
+                if not artifact.exists():
+                    shutil.rmtree(tmp_entry, ignore_errors=True)
+                    raise
+                inserted = False
+            if inserted and self._total_bytes is not None:
+                self._total_bytes += size
+        if not inserted:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            return self.get_path(key, filename)
+        self.evict(keep=key)
+        return artifact
+
+    def get_json(self, key: str, filename: str = 'data.json'):
+        path = self.get_path(key, filename)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def put_json(self, key: str, data, filename: str = 'data.json') -> Path:
+        tmp_path = self.root / f".{key}.{os.getpid()}-{threading.get_ident()}.json"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        return self.put_file(key, tmp_path, filename)
+
+    def _scan(self) -> list:
+        """列出全部条目 (修改时间, 大小, 目录)，同时校准累计大小。"""
+        entries = []
+        for bucket in self.root.iterdir():
+            if not bucket.is_dir(): continue
+            for entry in bucket.iterdir():
+                if not entry.is_dir() or '.tmp-' in entry.name: continue
+                try:
+                    size = sum(p.stat().st_size for p in entry.iterdir() if p.is_file())
+                    entries.append((entry.stat().st_mtime, size, entry))
+                except OSError:
+                    continue  # 其他进程正在淘汰该条目
+        self._total_bytes = sum(size for _, size, _ in entries)
+        return entries
+
+    def evict(self, keep: str = None):
+        """
+        总大小超过上限时，按最近访问时间从旧到新删除条目；keep 指定的条目 (刚写入的) 不会被删除。
+        累计大小在进程内随写入更新，只有超过上限时才重新扫描目录。
+        """
+        with self._lock:
+            if self._total_bytes is not None and self._total_bytes <= self.max_bytes:
+                return
+            entries = self._scan()
+            total = self._total_bytes
+            if total <= self.max_bytes:
+                return
+            entries.sort(key=lambda e: e[0])
+            for _, size, entry in entries:
+                if total <= self.max_bytes: break
+                if entry.name == keep: continue
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                print(f"缓存已满，淘汰条目: {entry.name}")
+            self._total_bytes = total
@@ -0,0 +1,166 @@
+# checkpoint.py
+"""
+按任务保存的流水线检查点。
+
+每个任务在 demucs_output/jobs/<job_id>/ 下有一个 manifest.json，记录已完成的阶段、
+阶段参数、产物路径与校验和。进程崩溃、被抢占或服务重启后，同一任务再次运行时
+从最后一个有效的阶段继续；参数或校验和对不上的阶段会被重新计算。
+任务成功结束后检查点即被删除，失败或中断的任务保留到过期为止。
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+
+CHECKPOINT_ROOT = Path('demucs_output/jobs')
+# 失败或中断后一直没有恢复的检查点保留时长
+CHECKPOINT_RETENTION_SECONDS = 7 * 24 * 3600
+MANIFEST_NAME = 'manifest.json'
+
+def file_checksum(path, chunk_size: int = 1024 * 1024 * 8) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk: break
+            h.update(chunk)
+    return h.hexdigest()
+
+def _normalize(params: dict) -> dict:
+    # 与从 manifest 读回的参数保持同一形式 (元组变列表、键排序)，才能直接比较
+    return json.loads(json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=str))
+
+def _write_atomic(path: Path, text: str):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    tmp.write_text(text, encoding='utf-8')
+    os.replace(tmp, path)
+
+
+class JobCheckpoint:
+    """
+    单个任务的检查点。manifest 每次更新都先写临时文件再替换，进程在任意时刻中断都不会留下半个文件。
+    说话人分离与转录在两个线程中并行完成，manifest 的修改与写入由锁串行化。
+    """
+    def __init__(self, job_id: str, root=CHECKPOINT_ROOT):
+        self.job_id = job_id
+        self._lock = threading.Lock()
+        self.dir = Path(root) / job_id
+        self.manifest_path = self.dir / MANIFEST_NAME
+        self.manifest = self._load()
+
+    def _load(self) -> dict:
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+            if isinstance(manifest.get('stages'), dict):
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {'job_id': self.job_id, 'inputs': None, 'stages': {}, 'last_stage': None}
+
+    def _save(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.manifest['updated_at'] = time.time()
+        _write_atomic(self.manifest_path, json.dumps(self.manifest, indent=2, ensure_ascii=False))
+
+    @property
+    def inputs(self) -> dict:
+        return self.manifest.get('inputs')
+
+    def begin(self, **inputs):
+        """记录任务输入。输入与已有检查点不一致时 (同一 ID 换了视频或参数) 丢弃旧的阶段记录。"""
+        inputs = _normalize(inputs)
+        if self.manifest.get('inputs') != inputs:
+            if self.manifest['stages']:
+                print(f"任务 {self.job_id} 的输入已变化，丢弃旧检查点。")
+            self.manifest = {'job_id': self.job_id, 'inputs': inputs, 'stages': {}, 'last_stage': None,
+                             'created_at': time.time()}
+            self._save()
+        elif self.manifest['stages']:
+            print(f"任务 {self.job_id} 从检查点恢复，已完成阶段: {', '.join(self.manifest['stages'])}")
+
+    def _valid_entry(self, stage: str, params: dict):
+        entry = self.manifest['stages'].get(stage)
+        if entry is None or entry.get('params') != _normalize(params):
+            return None
+        path = Path(entry['artifact'])
+        try:
+            if not path.is_file() or file_checksum(path) != entry['checksum']:
+                print(f"检查点 {stage} 的产物缺失或校验失败，将重新计算。")
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def _record(self, stage: str, params: dict, artifact: Path, checksum: str):
+        with self._lock:
+            self.manifest['stages'][stage] = {
+                'stage': stage,
+                'params': _normalize(params),
+                'artifact': str(artifact),
+                'checksum': checksum,
+                'completed_at': time.time(),
+            }
+            self.manifest['last_stage'] = stage
+            self._save()
+
+    def load_json(self, stage: str, params: dict):
+        """阶段已完成且参数、校验和都匹配时返回保存的数据，否则返回 None。"""
+        entry = self._valid_entry(stage, params)
+        if entry is None:
+            return None
+        with open(entry['artifact'], encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_json(self, stage: str, params: dict, data):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self.dir / f"{stage}.json"
+        _write_atomic(path, json.dumps(data, ensure_ascii=False))
+        self._record(stage, params, path, file_checksum(path))
+
+    def load_file(self, stage: str, params: dict):
+        entry = self._valid_entry(stage, params)
+        return Path(entry['artifact']) if entry else None
+
+    def save_file(self, stage: str, params: dict, path) -> Path:
+        """
+        把文件保存进检查点目录并记录，返回检查点中的路径。同一文件系统下使用硬链接，不占用额外空间；
+        中间产物缓存淘汰原文件后检查点中的副本仍然有效。
+        """
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = Path(path)
+        target = self.dir / f"{stage}{path.suffix}"
+        tmp = target.with_name(target.name + '.tmp')
+        if tmp.exists(): tmp.unlink()
+        try:
+            os.link(path, tmp)
+        except OSError:
+            shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+        self._record(stage, params, target, file_checksum(target))
+        return target
+
+    def discard(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+def prune_checkpoints(root=CHECKPOINT_ROOT, max_age: float = CHECKPOINT_RETENTION_SECONDS) -> int:
+    """删除超过 max_age 秒没有更新的检查点目录，返回删除的数量。"""
+    root = Path(root)
+    if not root.is_dir():
+        return 0
+    removed = 0
+    deadline = time.time() - max_age
+    for job_dir in root.iterdir():
+        if not job_dir.is_dir(): continue
+        manifest = job_dir / MANIFEST_NAME
+        try:
+            mtime = (manifest if manifest.exists() else job_dir).stat().st_mtime
+        except OSError:
+            continue
+        if mtime < deadline:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            removed += 1
+    return removed
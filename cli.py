@@ -0,0 +1,194 @@
+# cli.py
+"""
+无界面的批量字幕生成入口，适合 cron 或批处理系统调用。
+
+    python cli.py videos/ "archive/**/*.mp4" --output-dir subtitles --report report.json
+
+模型只加载一次；下一个文件的音频提取与人声分离在后台线程中进行，与当前文件的识别与转录重叠。
+已有且比视频更新的字幕文件会被跳过。任一文件失败时以非零状态码退出。
+进程被中断 (例如抢占式节点被回收) 后用相同参数重跑，未完成的文件从各自的检查点继续。
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import traceback
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from config import get_config, is_config_valid
+from metrics import PipelineMetrics, DEFAULT_METRICS_PATH
+from export import EXPORTERS, write_subtitles
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.avi', '.webm', '.flv', '.m4v', '.mp3', '.wav', '.m4a', '.flac')
+
+def _glob_root(pattern: str) -> Path:
+    """通配符中第一个含通配符的部分之前的目录，例如 archive/**/*.mp4 的根目录为 archive。"""
+    root = []
+    for part in Path(pattern).parts:
+        if glob.has_magic(part): break
+        root.append(part)
+    return Path(*root) if root else Path('.')
+
+def collect_inputs(patterns: list, extensions=VIDEO_EXTENSIONS) -> list:
+    """
+    展开目录 (递归) 与通配符，返回去重且按路径排序的 (文件绝对路径, 相对输入根目录的路径) 列表。
+    目录的根为目录本身，通配符的根为其不含通配符的前缀，单个文件的相对路径就是文件名。
+    """
+    found = {}
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            root, candidates = path, path.rglob('*')
+        elif path.is_file():
+            root, candidates = path.parent, [path]
+        else:
+            root, candidates = _glob_root(pattern), (Path(p) for p in glob.glob(pattern, recursive=True))
+        for p in candidates:
+            if not p.is_file() or p.suffix.lower() not in extensions: continue
+            relative = Path(os.path.relpath(os.path.abspath(p), os.path.abspath(root)))
+            found.setdefault(p.resolve(), relative if not relative.parts or relative.parts[0] != '..' else Path(p.name))
+    return sorted(found.items())
+
+def subtitle_target(video_path: Path, output_dir: Path = None, fmt: str = 'srt', relative: Path = None) -> Path:
+    """默认与视频放在同一目录；指定 output_dir 时按 relative 在其下重建输入的目录结构，避免同名文件互相覆盖。"""
+    if output_dir is None:
+        return video_path.parent / f"{video_path.stem}.{fmt}"
+    relative = relative or Path(video_path.name)
+    return output_dir / relative.parent / f"{relative.stem}.{fmt}"
+
+def is_up_to_date(video_path: Path, subtitle_path: Path) -> bool:
+    return subtitle_path.exists() and subtitle_path.stat().st_mtime >= video_path.stat().st_mtime
+
+def batch_job_id(video_path: Path) -> str:
+    """由路径、大小与修改时间得出的稳定任务 ID。批处理被中断后重跑时，同一文件沿用上次的检查点。"""
+    st = video_path.stat()
+    return hashlib.sha256(f"{video_path}|{st.st_size}|{st.st_mtime_ns}".encode('utf-8')).hexdigest()[:32]
+
+
+class BatchRunner:
+    """
+    两级流水线：后台线程为第 N+1 个文件提取音频并分离人声 (结果进入中间产物缓存)，
+    主线程同时对第 N 个文件做说话人识别、转录与导出。之后 run() 的分离阶段直接命中缓存。
+    """
+    def __init__(self, generator, metrics_path=DEFAULT_METRICS_PATH, language: str = None,
+                 num_speakers: int = None, output_dir: Path = None, fmt: str = 'srt', force: bool = False):
+        self.generator = generator
+        self.metrics_path = metrics_path
+        self.language = language
+        self.num_speakers = num_speakers
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.force = force
+
+    def _prefetch(self, video_path: Path, job_id: str) -> float:
+        started = time.perf_counter()
+        metrics = PipelineMetrics(job_id, str(video_path), path=self.metrics_path)
+        self.generator.separate_vocals(str(video_path), metrics=metrics)
+        return time.perf_counter() - started
+
+    def process(self, files: list) -> list:
+        results = []
+        pending = []
+        targets = {}
+        for video_path, relative in files:
+            subtitle_path = subtitle_target(video_path, self.output_dir, self.fmt, relative)
+            # 不同输入根下的同名文件仍可能落到同一路径，后出现的判为失败而不是悄悄覆盖
+            owner = targets.setdefault(subtitle_path.resolve(), video_path)
+            if owner != video_path:
+                print(f"失败 (输出路径与 {owner} 冲突): {video_path}")
+                results.append({'video': str(video_path), 'subtitle': str(subtitle_path), 'status': 'failed',
+                                'error': f"输出路径与 {owner} 的字幕冲突"})
+            elif not self.force and is_up_to_date(video_path, subtitle_path):
+                print(f"跳过 (字幕已是最新): {video_path}")
+                results.append({'video': str(video_path), 'subtitle': str(subtitle_path), 'status': 'skipped'})
+            else:
+                pending.append((video_path, subtitle_path, batch_job_id(video_path)))
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='batch-prefetch') as prefetcher:
+            future = prefetcher.submit(self._prefetch, pending[0][0], pending[0][2]) if pending else None
+            for i, (video_path, subtitle_path, job_id) in enumerate(pending):
+                print(f"[{i + 1}/{len(pending)}] {video_path}")
+                record = {'video': str(video_path), 'subtitle': str(subtitle_path), 'job_id': job_id}
+                started = time.perf_counter()
+                try:
+                    wait_started = time.perf_counter()
+                    prefetch_error = None
+                    try:
+                        record['separation_seconds'] = round(future.result(), 3)
+                    except Exception as e:
+                        prefetch_error = e
+                    record['wait_seconds'] = round(time.perf_counter() - wait_started, 3)
+                    # 当前文件的音频已就绪，立即为下一个文件开始分离
+                    if i + 1 < len(pending):
+                        future = prefetcher.submit(self._prefetch, pending[i + 1][0], pending[i + 1][2])
+                    if prefetch_error is not None:
+                        raise prefetch_error
+
+                    run_started = time.perf_counter()
+                    segments = self.generator.run(str(video_path), language=self.language,
+                                                  num_speakers=self.num_speakers, job_id=job_id)
+                    record['run_seconds'] = round(time.perf_counter() - run_started, 3)
+                    record['segments'] = len(segments)
+                    record['profile'] = self.generator.last_run_info
+                    subtitle_path.parent.mkdir(parents=True, exist_ok=True)
+                    write_subtitles(segments, subtitle_path, self.fmt)
+                    record['status'] = 'done'
+                except Exception as e:
+                    traceback.print_exc()
+                    record['status'] = 'failed'
+                    record['error'] = str(e)
+                record['total_seconds'] = round(time.perf_counter() - started, 3)
+                results.append(record)
+        return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="批量生成字幕 (无界面)")
+    parser.add_argument('inputs', nargs='+', help="视频文件、目录 (递归) 或通配符")
+    parser.add_argument('--output-dir', help="字幕输出目录，默认与视频放在同一目录")
+    parser.add_argument('--format', default='srt', choices=sorted(EXPORTERS), help="字幕格式")
+    parser.add_argument('--language', help="语言代码，如 zh、en；默认自动检测")
+    parser.add_argument('--num-speakers', type=int, help="说话人数；默认自动检测")
+    parser.add_argument('--force', action='store_true', help="即使字幕已是最新也重新生成")
+    parser.add_argument('--report', default='batch_report.json', help="汇总报告路径")
+    args = parser.parse_args(argv)
+
+    config = get_config()
+    if not is_config_valid(config):
+        print("配置无效或不完整，请先通过网页设置页或 config.json 完成配置。", file=sys.stderr)
+        return 2
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("没有找到可处理的视频文件。", file=sys.stderr)
+        return 2
+
+    from cpu_tuning import apply_cpu_limits
+    apply_cpu_limits(config)
+    from get_subtitle import SubtitleGenerator
+    generator = SubtitleGenerator(config)
+    runner = BatchRunner(generator, metrics_path=config.get('metrics_path') or DEFAULT_METRICS_PATH,
+                         language=args.language, num_speakers=args.num_speakers,
+                         output_dir=Path(args.output_dir) if args.output_dir else None, fmt=args.format,
+                         force=args.force)
+    started = time.time()
+    results = runner.process(files)
+    counts = {status: sum(r['status'] == status for r in results) for status in ('done', 'skipped', 'failed')}
+    report = {
+        'started': started,
+        'finished': time.time(),
+        'wall_seconds': round(time.time() - started, 3),
+        'counts': counts,
+        'files': results,
+    }
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"完成: {counts['done']} 个，跳过: {counts['skipped']} 个，失败: {counts['failed']} 个。报告已写入 {args.report}")
+    return 1 if counts['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,26 @@ from pathlib import Path
 
 CONFIG_FILE = Path('config.json')
 
+# 速度/质量档位：决定 Whisper 模型、解码参数以及是否进行人声分离
+PIPELINE_PROFILES = {
+    'fast': {
+        'model_name': 'small',
+        'separation': 'auto', # 先估计背景声，干净的人声 (播客、讲座) 直接跳过 Demucs
+        'decode_options': {'beam_size': None, 'temperature': [0.0]}, # 贪心解码，不做温度回退
+    },
+    'balanced': {
+        'model_name': None, # 使用 model_name 配置项
+        'separation': 'always',
+        'decode_options': {'beam_size': None, 'temperature': [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
+    },
+    'accurate': {
+        'model_name': 'large-v3',
+        'separation': 'always',
+        'decode_options': {'beam_size': 5, 'best_of': 5, 'temperature': [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
+    },
+}
+DEFAULT_PROFILE = 'balanced'
+
 def get_config() -> dict:
     """
     加载配置文件。如果文件不存在，返回一个包含默认值的字典。
@@ -13,10 +33,46 @@ def get_config() -> dict:
         # 提供一个默认/空的配置结构
         return {
             'model_name': 'large-v3',
+            'pipeline_profile': DEFAULT_PROFILE, # fast / balanced / accurate，见 PIPELINE_PROFILES
+            'auto_separation_floor_db': -25, # fast 档：停顿处电平低于最响处这么多 dB 才视为没有背景声
+            'auto_separation_low_ratio': 0.05, # fast 档：80 Hz 以下的低频能量占比上限
+            'asr_backend': 'openai-whisper', # 语音识别后端：openai-whisper / faster-whisper
+            'asr_compute_type': '', # 推理精度，留空按后端与设备自动选择 (faster-whisper 在 CPU 上为 int8)
+            'cpu_quantize_whisper': False, # 仅 CPU：asr_compute_type 留空时对 openai-whisper 的 Linear 层做动态 int8 量化 (有损，先用基准测试核对字错误率)
+            'cpu_quantize_demucs': False, # 仅 CPU：对 Demucs 的 Linear 层做动态 int8 量化 (主要计算在卷积层，收益有限)
+            'cpu_threads_per_job': 0, # 每个工作进程的 torch 线程数，0 为可用核心数 / 工作进程数
+            'cpu_interop_threads': 1, # 每个工作进程的 torch inter-op 线程数，0 为 torch 默认值
+            'cpu_affinity': '', # 工作进程绑核：留空不绑定，auto 平均分配，或 0-3;4-7 按进程指定核心集合
             'use_deepseek': False,
             'deepseek_api_key': None,
+            'deepseek_base_url': 'https://api.deepseek.com', # 任意 OpenAI 兼容接口地址，可指向本地测试服务
+            'deepseek_model': 'deepseek-chat',
+            'llm_chunk_tokens': 1500, # 每次请求的字幕 token 预算
+            'llm_max_concurrency': 4, # 同时进行的请求数上限
+            'llm_timeout': 60, # 单次请求超时 (秒)
+            'llm_max_retries': 3, # 失败后按指数退避重试的次数
+            'llm_cache_enabled': True, # 缓存逐句润色结果，重复内容不再调用接口
+            'llm_cache_path': 'demucs_output/llm_cache.db',
+            'llm_cache_ttl_days': 30,
+            'llm_cache_max_entries': 100000,
             'hf_token': None,
             'hf_cache_dir': None, # 新增：允许用户自定义缓存目录
+            'artifact_cache_dir': 'demucs_output/artifacts', # 中间产物缓存目录
+            'artifact_cache_max_gb': 20, # 中间产物缓存容量上限 (GB)，超出后按 LRU 淘汰
+            'demucs_chunk_seconds': 60, # Demucs 流式分离的分块长度 (秒)，决定峰值内存；0 表示整段处理
+            'demucs_overlap_seconds': 5, # 相邻分块的重叠长度 (秒)，用于交叉淡化拼接
+            'vad_enabled': True, # 转录与说话人分离前跳过静音与纯音乐段
+            'vad_margin_db': 10, # 高于噪声底多少 dB 视为语音
+            'vad_min_silence': 0.6, # 短于此长度 (秒) 的静音不会被切掉
+            'vad_pad': 0.25, # 每段语音两侧保留的余量 (秒)
+            'whisper_workers': 0, # 仅 CPU：并行转录的进程数，0 或 1 表示不分块、单进程转录
+            'whisper_threads_per_worker': 0, # 每个转录进程的 torch 线程数，0 表示按 CPU 核数平均分配
+            'whisper_chunk_seconds': 120, # 并行转录时每块的目标长度 (秒)，切点落在附近的静音处
+            'stream_chunk_seconds': 60, # 网页任务边转录边展示时每块的目标长度 (秒)，越短首批字幕出现得越早
+            'num_workers': 1, # 字幕生成工作进程数，每个进程各自加载一套模型
+            'prewarm_models': True, # 工作进程启动后在后台预先加载模型
+            'metrics_path': 'demucs_output/metrics.jsonl', # 各阶段耗时与资源占用记录 (JSON Lines)
+            'metrics_endpoint': True, # 在 /metrics 以 Prometheus 文本格式暴露统计
         }
     with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
         try:
@@ -25,6 +81,16 @@ def get_config() -> dict:
             # 如果文件损坏，也返回默认值
             return get_config()
 
+def get_profile(config: dict) -> tuple:
+    """返回 (档位名称, 档位参数)，档位参数中的 model_name 已按配置补全。"""
+    name = config.get('pipeline_profile') or DEFAULT_PROFILE
+    if name not in PIPELINE_PROFILES:
+        print(f"警告: 未知的处理档位 '{name}'，使用 {DEFAULT_PROFILE}。")
+        name = DEFAULT_PROFILE
+    profile = dict(PIPELINE_PROFILES[name])
+    profile['model_name'] = profile['model_name'] or config.get('model_name', 'large-v3')
+    return name, profile
+
 def save_config(config: dict):
     """将配置字典保存到文件。"""
     with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
@@ -0,0 +1,113 @@
+# cpu_tuning.py
+"""
+CPU 推理调优：Linear 层的动态 int8 量化、每个任务的 torch 线程数上限，以及工作进程绑核。
+
+多个工作进程同时运行时，torch 默认每个进程都按全部核心开线程，核心被严重超额订阅；
+按进程划分核心并限制线程数后，各任务互不争抢，总吞吐通常更高。
+"""
+
+import os
+
+def available_cpus() -> int:
+    """当前进程可以使用的核心数；绑核后只计算绑定的核心。"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        return os.cpu_count() or 1
+
+def _parse_cores(text: str) -> set:
+    cores = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part: continue
+        if '-' in part:
+            lo, hi = part.split('-', 1)
+            cores.update(range(int(lo), int(hi) + 1))
+        else:
+            cores.add(int(part))
+    return cores
+
+def parse_core_sets(spec: str, num_workers: int = 1) -> list:
+    """
+    解析 cpu_affinity 配置，返回各工作进程的核心集合列表；空值表示不绑核。
+
+    - 'auto': 把当前可用的核心平均分给 num_workers 个进程
+    - '0-3;4-7' 或 '0,2,4;1,3,5': 分号分隔各进程的核心集合，进程数多于集合数时循环使用
+    """
+    spec = (spec or '').strip()
+    if not spec:
+        return []
+    if spec == 'auto':
+        try:
+            cores = sorted(os.sched_getaffinity(0))
+        except AttributeError:
+            cores = list(range(os.cpu_count() or 1))
+        # 连续划分，相邻编号的核心 (通常同属一个物理核或 CCX) 留在同一个进程
+        num_workers = max(1, min(num_workers, len(cores)))
+        bounds = [len(cores) * i // num_workers for i in range(num_workers + 1)]
+        return [set(cores[bounds[i]:bounds[i + 1]]) for i in range(num_workers)]
+    try:
+        sets = [_parse_cores(part) for part in spec.split(';') if part.strip()]
+    except ValueError:
+        raise ValueError(f"cpu_affinity 格式错误: '{spec}'，示例: auto 或 0-3;4-7")
+    return [cores for cores in sets if cores]
+
+def apply_cpu_limits(config: dict, worker_index: int = 0, num_workers: int = 1) -> dict:
+    """
+    按配置为当前进程绑核并设置 torch 的 intra-op / inter-op 线程数，返回实际生效的设置。
+    应在进程开始任何 torch 运算之前调用：inter-op 线程数在线程池启动后就不能再修改。
+    由这个进程启动的子进程 (例如多进程转录) 会继承绑定的核心。
+    """
+    import torch
+    applied = {}
+    core_sets = parse_core_sets(config.get('cpu_affinity'), num_workers)
+    if core_sets:
+        cores = core_sets[worker_index % len(core_sets)]
+        try:
+            os.sched_setaffinity(0, cores)
+            # 内核只保留在线的核心，以实际生效的集合为准
+            applied['cores'] = sorted(os.sched_getaffinity(0))
+        except AttributeError:
+            print("警告: 当前系统不支持 os.sched_setaffinity，忽略 cpu_affinity。")
+        except OSError as e:
+            print(f"警告: 绑定核心 {sorted(cores)} 失败: {e}")
+
+    # 已绑核时可用核心就是本进程独占的核心，否则按工作进程数平分
+    threads = int(config.get('cpu_threads_per_job', 0) or 0)
+    if not threads:
+        threads = max(1, available_cpus() // (1 if 'cores' in applied else max(1, num_workers)))
+    torch.set_num_threads(threads)
+    applied['threads'] = threads
+
+    interop = int(config.get('cpu_interop_threads', 1) or 0)
+    if interop:
+        try:
+            torch.set_num_interop_threads(interop)
+            applied['interop_threads'] = interop
+        except RuntimeError:
+            print("警告: torch 已开始并行计算，inter-op 线程数无法再修改，沿用当前设置。")
+    applied.setdefault('interop_threads', torch.get_num_interop_threads())
+    return applied
+
+def quantize_linear_int8(model):
+    """
+    对模型中的 Linear 层做动态 int8 量化 (权重预先量化，激活在推理时按批动态量化)，返回新的模型，原模型不变。
+    卷积层与嵌入层保持 fp32。量化后的模型只能在 CPU 上运行。
+
+    Whisper 的 Linear 是 nn.Linear 的子类，torch 只转换精确类型为 nn.Linear 的层，
+    所以先换成共享参数的 nn.Linear。多头注意力内部直接读取 out_proj 权重，不能量化，保持原样。
+    """
+    import copy
+    import torch
+    from torch import nn
+    from torch.nn.modules.linear import NonDynamicallyQuantizableLinear
+
+    model = copy.deepcopy(model).cpu().eval()
+    for parent in list(model.modules()):
+        for name, child in parent.named_children():
+            if (isinstance(child, nn.Linear) and type(child) is not nn.Linear
+                    and not isinstance(child, NonDynamicallyQuantizableLinear)):
+                plain = nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+                plain.weight, plain.bias = child.weight, child.bias
+                setattr(parent, name, plain)
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
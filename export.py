@@ -0,0 +1,55 @@
+# export.py
+
+import json
+from pathlib import Path
+
+# 流水线产出的片段格式: {'start': 秒, 'end': 秒, 'speaker': str, 'text': str, 'words': [{'start', 'end', 'word'}] 或 None}
+
+def format_timestamp(t, sep: str = ',') -> str:
+    """秒数转为 HH:MM:SS,mmm (SRT) 或 HH:MM:SS.mmm (VTT)。"""
+    if t is None or not isinstance(t, (int, float)): t = 0.0
+    total_ms = int(round(max(0.0, t) * 1000))
+    h, rem = divmod(total_ms, 3600 * 1000)
+    m, rem = divmod(rem, 60 * 1000)
+    s, ms = divmod(rem, 1000)
+    return f"{h:02}:{m:02}:{s:02}{sep}{ms:03}"
+
+def _cues(segments: list):
+    for seg in segments:
+        text = (seg.get('text') or '').strip()
+        if text:
+            yield seg, text
+
+def to_srt(segments: list) -> str:
+    """每条字幕格式为 "说话人: 文本"。"""
+    lines = []
+    for i, (seg, text) in enumerate(_cues(segments)):
+        lines.append(f"{i + 1}\n{format_timestamp(seg.get('start'))} --> {format_timestamp(seg.get('end'))}\n"
+                     f"{seg.get('speaker') or '未知'}: {text}\n")
+    return "\n".join(lines)
+
+def to_vtt(segments: list) -> str:
+    """说话人写成 WebVTT 的声音标签 <v 说话人>，名称中可以包含空格与冒号。"""
+    lines = ["WEBVTT\n"]
+    for seg, text in _cues(segments):
+        lines.append(f"{format_timestamp(seg.get('start'), '.')} --> {format_timestamp(seg.get('end'), '.')}\n"
+                     f"<v {seg.get('speaker') or '未知'}>{text}\n")
+    return "\n".join(lines)
+
+def to_json(segments: list) -> str:
+    return json.dumps([{**seg, 'text': text} for seg, text in _cues(segments)], ensure_ascii=False, indent=2)
+
+EXPORTERS = {
+    'srt': to_srt,
+    'vtt': to_vtt,
+    'json': to_json,
+}
+
+def write_subtitles(segments: list, path, fmt: str = None) -> Path:
+    """按 fmt (默认取文件扩展名) 导出字幕文件。"""
+    path = Path(path)
+    fmt = (fmt or path.suffix.lstrip('.') or 'srt').lower()
+    if fmt not in EXPORTERS:
+        raise ValueError(f"不支持的字幕格式: {fmt}")
+    path.write_text(EXPORTERS[fmt](segments), encoding='utf-8')
+    return path
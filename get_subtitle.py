@@ -1,44 +1,225 @@
 # backend.py
 
 import os
+import copy
+import uuid
+import queue
+import bisect
 import asyncio
 from pathlib import Path
 import traceback
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import torch
-import whisper
-import torchaudio
 import soundfile as sf
-from openai import OpenAI
-from moviepy import VideoFileClip
-from demucs.pretrained import get_model
 from demucs.apply import apply_model
-from pyannote.audio import Pipeline
-
-# --- 辅助函数 (保持不变) ---
-def assign_speaker_to_whisper_segments(diarization_result, whisper_segments):
-    # ... (此函数代码与您提供的版本相同，此处省略以保持简洁)
-    speaker_timestamps = []
-    for turn, _, speaker in diarization_result.itertracks(yield_label=True):
-        speaker_timestamps.append({'start': turn.start, 'end': turn.end, 'speaker': speaker})
+from cache import ArtifactCache
+from models import registry
+from llm import SubtitleRefiner
+from parallel_whisper import ParallelWhisper, transcribe_chunked
+from asr import ASR_BACKENDS, DEFAULT_ASR_BACKEND, default_compute_type
+from metrics import PipelineMetrics, DEFAULT_METRICS_PATH
+from checkpoint import JobCheckpoint
+from cpu_tuning import available_cpus
+from config import get_profile
+from audio import (load_audio, iter_audio_chunks, detect_speech_regions, compact_audio, estimate_background,
+                   TimeMap, AudioBuffer, MODEL_SAMPLE_RATE)
+
+DEMUCS_MODEL_NAME = "htdemucs"
+DIARIZATION_PIPELINE_NAME = "pyannote/speaker-diarization-3.1"
+
+# --- 辅助函数 ---
+def _diarization_turns(diarization_result) -> list:
+    """
+    将 Pyannote 的 Annotation (或已序列化的 (start, end, speaker) 列表) 统一为
+    按开始时间排序的 (start, end, speaker) 元组列表。
+    """
+    if hasattr(diarization_result, 'itertracks'):
+        turns = [(turn.start, turn.end, speaker)
+                 for turn, _, speaker in diarization_result.itertracks(yield_label=True)]
+    else:
+        turns = [(float(s), float(e), spk) for s, e, spk in diarization_result]
+    turns = [t for t in turns if t[1] > t[0]]
+    turns.sort(key=lambda t: (t[0], t[1], str(t[2])))
+    return turns
+
+
+class _SpeakerIntervals:
+    """
+    单个说话人的区间索引。同一说话人的重叠片段会先合并，
+    再用前缀和记录累计时长，从而在 O(log M) 内求出与任意区间的重叠时长。
+    """
+    __slots__ = ('starts', 'ends', 'cum')
+
+    def __init__(self, intervals: list):
+        merged = []
+        for s, e in sorted(intervals):
+            if merged and s <= merged[-1][1]:
+                if e > merged[-1][1]: merged[-1][1] = e
+            else:
+                merged.append([s, e])
+        self.starts = [s for s, _ in merged]
+        self.ends = [e for _, e in merged]
+        self.cum = [0.0]
+        for s, e in merged:
+            self.cum.append(self.cum[-1] + (e - s))
+
+    def _covered_until(self, t: float) -> float:
+        # 在 t 之前已结束的片段全部计入，再加上 t 所在片段的部分时长
+        k = bisect.bisect_right(self.ends, t)
+        covered = self.cum[k]
+        if k < len(self.starts) and self.starts[k] < t:
+            covered += t - self.starts[k]
+        return covered
+
+    def overlap(self, start: float, end: float) -> float:
+        return self._covered_until(end) - self._covered_until(start)
+
+    def distance(self, t: float) -> float:
+        """t 到该说话人最近片段的距离 (t 在片段内时为 0)。"""
+        k = bisect.bisect_right(self.starts, t) - 1
+        best = float('inf')
+        if k >= 0:
+            best = max(0.0, t - self.ends[k])
+        if k + 1 < len(self.starts):
+            best = min(best, self.starts[k + 1] - t)
+        return best
+
+
+# 比较重叠时长时的容差 (秒)
+_OVERLAP_EPSILON = 1e-9
+
+def assign_speaker_to_whisper_segments(diarization_result, whisper_segments, max_gap: float = 1.0):
+    """
+    为每个 Whisper 片段分配与其时间重叠最长的说话人。
+
+    - 重叠时长相同 (例如多人同时说话) 时，按说话人标签排序取第一个，保证结果确定。
+    - 片段落在说话人片段之间的空隙中时，取距离最近且不超过 max_gap 秒的说话人，否则为 '未知'。
+    - 复杂度为 O(M log M + N * S * log M)，S 为说话人数 (通常为个位数)。
+    """
+    turns = _diarization_turns(diarization_result)
+    by_speaker = {}
+    for s, e, spk in turns:
+        by_speaker.setdefault(spk, []).append((s, e))
+    # 固定的说话人顺序用于打破平局
+    index = [(spk, _SpeakerIntervals(iv)) for spk, iv in sorted(by_speaker.items(), key=lambda kv: str(kv[0]))]
+
     for seg in whisper_segments:
-        segment_center = seg.get('start', 0) + (seg.get('end', 0) - seg.get('start', 0)) / 2
+        start = seg.get('start', 0) or 0
+        end = seg.get('end', start) or start
+        if end < start: start, end = end, start
         assigned_speaker = '未知'
-        for turn in speaker_timestamps:
-            if segment_center >= turn['start'] and segment_center <= turn['end']:
-                assigned_speaker = turn['speaker']
-                break
+        best_overlap = 0.0
+        for spk, intervals in index:
+            ov = intervals.overlap(start, end)
+            # 重叠时长由前缀和相减得到，带有浮点舍入误差；差距在容差内视为平局，保留顺序靠前的说话人
+            if ov > best_overlap + _OVERLAP_EPSILON:
+                best_overlap, assigned_speaker = ov, spk
+        if best_overlap <= 0.0 and index:
+            best_dist = max_gap
+            for spk, intervals in index:
+                d = min(intervals.distance(start), intervals.distance(end))
+                if d <= best_dist and (d < best_dist or assigned_speaker == '未知'):
+                    best_dist, assigned_speaker = d, spk
         seg['speaker'] = assigned_speaker
     return whisper_segments
 
 
+def to_public_segment(seg: dict) -> dict:
+    """流水线对外的片段格式：起止秒数、说话人、文本，以及 (若有) 逐词时间戳。"""
+    words = seg.get('words')
+    return {
+        'start': seg.get('start'),
+        'end': seg.get('end'),
+        'speaker': seg.get('speaker'),
+        'text': (seg.get('text') or '').strip(),
+        'words': [{'start': w.get('start'), 'end': w.get('end'), 'word': w.get('word')} for w in words] if words else None,
+    }
+
+
+class _SegmentStream:
+    """
+    把转录过程中逐块产生的片段转发给 segment_handler(start_index, segments, final)，
+    含义为从 start_index 起用 segments 覆盖已发出的片段；final 为 True 时其后的片段一并作废。
+    说话人识别完成前片段的 speaker 为 None，识别结果到达后已发出的片段会补上说话人再发送一次。
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.segments = []
+        self.turns = None
+        self._lock = threading.Lock()
+
+    def add(self, segments: list):
+        """segments 须已是原始时间轴上的片段。"""
+        segments = [dict(seg) for seg in segments]
+        with self._lock:
+            if self.turns is not None:
+                assign_speaker_to_whisper_segments(self.turns, segments)
+            start = len(self.segments)
+            self.segments.extend(segments)
+            self.handler(start, [to_public_segment(seg) for seg in segments], False)
+
+    def set_turns(self, turns: list):
+        with self._lock:
+            self.turns = turns
+            if self.segments:
+                assign_speaker_to_whisper_segments(turns, self.segments)
+                self.handler(0, [to_public_segment(seg) for seg in self.segments], False)
+
+    def finish(self, segments: list):
+        """segments 为最终结果 (已是对外格式)。"""
+        with self._lock:
+            self.handler(0, segments, True)
+
+
+def separate_vocals_streaming(model, chunks, out_path, device: str, overlap_samples: int, progress=None) -> int:
+    """
+    分块运行 Demucs，只保留人声并边处理边写入 out_path。
+
+    相邻窗口重叠 overlap_samples 个采样点，重叠区使用线性交叉淡化拼接。
+    峰值内存只取决于分块长度，与输入总时长无关。返回写入的采样点数。
+    每处理完一块调用 progress(已处理的秒数)，任务取消可在块之间生效。
+    """
+    vocals_index = model.sources.index("vocals")
+    prev_tail_in = None   # 上一窗口末尾的输入，作为下一窗口的开头
+    prev_tail_out = None  # 上一窗口末尾尚未写出的人声，等待与下一窗口交叉淡化
+    written = 0
+    with sf.SoundFile(str(out_path), 'w', samplerate=model.samplerate, channels=model.audio_channels) as out:
+        for chunk in chunks:
+            window = chunk if prev_tail_in is None else np.concatenate([prev_tail_in, chunk], axis=1)
+            sources = apply_model(model, torch.from_numpy(window).unsqueeze(0).to(device), split=True, device=device)
+            vocals = sources[0, vocals_index].cpu().numpy()
+            del sources
+            if prev_tail_out is not None:
+                k = prev_tail_out.shape[1]
+                fade = np.linspace(0.0, 1.0, k, dtype=np.float32)
+                vocals[:, :k] = prev_tail_out * (1.0 - fade) + vocals[:, :k] * fade
+            tail_len = min(overlap_samples, window.shape[1])
+            if tail_len > 0:
+                out.write(vocals[:, :-tail_len].T)
+                written += vocals.shape[1] - tail_len
+                prev_tail_in = window[:, -tail_len:]
+                prev_tail_out = vocals[:, -tail_len:]
+            else:
+                out.write(vocals.T)
+                written += vocals.shape[1]
+            if progress: progress(written / model.samplerate)
+        if prev_tail_out is not None:
+            out.write(prev_tail_out.T)
+            written += prev_tail_out.shape[1]
+    return written
+
+
 class SubtitleGenerator:
     """
     集成了 Demucs, Pyannote, Whisper 和 LLM 优化的字幕生成器。
-    模型在初始化时加载一次，专为后端服务设计。
+    模型通过进程内的注册表在首次使用时加载，并在多次运行之间复用。
     """
     def __init__(self, config: dict):
         self.conf = config
+        self.profile_name, self.profile = get_profile(config)
+        self.last_run_info = None  # 最近一次 run() 实际使用的档位、模型与解码参数
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
         print(f"字幕生成器使用设备: {self.device}")
 
@@ -52,135 +233,451 @@ class SubtitleGenerator:
         if not self.conf.get('hf_token'):
             raise ValueError("Hugging Face Token 未在配置中提供，无法加载 Pyannote 模型。")
         
-        print("正在加载所有模型，应用启动可能需要一些时间...")
-        self.demucs_model = get_model("htdemucs").to(self.device)
-        self.demucs_model.eval()
+        # 中间产物缓存：重新运行时只重算输入发生变化的阶段
+        self.artifact_cache = ArtifactCache(
+            self.conf.get('artifact_cache_dir') or 'demucs_output/artifacts',
+            max_bytes=int(float(self.conf.get('artifact_cache_max_gb', 20)) * 1024 ** 3),
+        )
 
-        whisper_model_name = self.conf.get('model_name', "large-v3")
-        self.whisper_model = whisper.load_model(whisper_model_name, device=self.device)
+        self._init_llm_client()
+        self._parallel_whisper = None
         
-        self.diarization_pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1", use_auth_token=self.conf['hf_token']
-        ).to(torch.device(self.device))
+        print("字幕生成器已就绪，模型将在首次使用时加载。")
+
+    # --- 模型通过注册表按需加载，并按 (名称, 设备, 精度) 缓存 ---
+    @property
+    def demucs_model(self):
+        return registry.get('demucs', DEMUCS_MODEL_NAME, self.device, dtype=self._demucs_dtype())
+
+    @property
+    def asr_model(self):
+        """当前语音识别后端 (接口见 asr.py)，注册表中按后端类型、模型名与推理精度缓存。"""
+        backend, dtype = self._asr_settings()
+        # torch 线程数已由 apply_cpu_limits 按 cpu_threads_per_job 与绑核设置；CTranslate2 不读取它，需要显式传入
+        return registry.get(backend, self.whisper_model_name, self.device, dtype=dtype,
+                            cpu_threads=torch.get_num_threads())
+
+    @property
+    def whisper_model_name(self) -> str:
+        """由处理档位决定；balanced 档位使用 model_name 配置项。"""
+        return self.profile['model_name']
+
+    @property
+    def diarization_pipeline(self):
+        return registry.get('diarization', DIARIZATION_PIPELINE_NAME, self.device, hf_token=self.conf['hf_token'])
+
+    def update_config(self, config: dict):
+        """
+        应用新的配置而无需重启进程。Whisper 模型名称变化时卸载旧模型，
+        新模型会在下一次使用 (或预热) 时加载。
+        """
+        old_model_name, (old_backend, old_dtype) = self.whisper_model_name, self._asr_settings()
+        old_demucs_dtype = self._demucs_dtype()
+        self.conf = config
+        self.profile_name, self.profile = get_profile(config)
+        new_model_name, (new_backend, new_dtype) = self.whisper_model_name, self._asr_settings()
+        if self._demucs_dtype() != old_demucs_dtype:
+            registry.evict('demucs')
+        if new_backend != old_backend:
+            print(f"语音识别后端已从 {old_backend} 切换为 {new_backend}。")
+            registry.evict(old_backend)
+        elif (new_model_name, new_dtype) != (old_model_name, old_dtype):
+            print(f"Whisper 模型已从 {old_model_name} ({old_dtype}) 切换为 {new_model_name} ({new_dtype})。")
+            registry.evict(new_backend, keep_name=new_model_name if new_dtype == old_dtype else None)
+        if self._parallel_whisper and ((self._parallel_whisper.model_name, self._parallel_whisper.backend,
+                                        self._parallel_whisper.dtype) != (new_model_name, new_backend, new_dtype)
+                                       or self._parallel_whisper_settings() != (self._parallel_whisper.workers,
+                                                                                self._parallel_whisper.threads_per_worker)):
+            self._parallel_whisper.shutdown()
+            self._parallel_whisper = None
+        self._init_llm_client()
+
+    def prewarm(self):
+        """在后台线程中预先加载全部模型，调用方无需等待。"""
+        loaders = [lambda: self.demucs_model, lambda: self.diarization_pipeline]
+        # 多进程转录时模型由各转录进程自行加载，主进程中无需再载入一份
+        if self._parallel_whisper_settings() is None:
+            loaders.append(lambda: self.asr_model)
+        return registry.prewarm(loaders)
+
+    def _vad_params(self):
+        """语音活动检测参数；未启用时返回 None。参数也参与缓存键的计算。"""
+        if not self.conf.get('vad_enabled', True):
+            return None
+        return {
+            'margin_db': float(self.conf.get('vad_margin_db', 10.0)),
+            'min_silence': float(self.conf.get('vad_min_silence', 0.6)),
+            'pad': float(self.conf.get('vad_pad', 0.25)),
+        }
 
+    def _asr_settings(self) -> tuple:
+        """(语音识别后端, 推理精度)。asr_compute_type 为空时使用后端在当前设备上的默认精度。"""
+        backend = self.conf.get('asr_backend') or DEFAULT_ASR_BACKEND
+        if backend not in ASR_BACKENDS:
+            print(f"警告: 未知的语音识别后端 '{backend}'，使用 {DEFAULT_ASR_BACKEND}。")
+            backend = DEFAULT_ASR_BACKEND
+        dtype = self.conf.get('asr_compute_type') or default_compute_type(
+            backend, self.device, quantize=self.conf.get('cpu_quantize_whisper', False))
+        return backend, dtype
+
+    def _demucs_dtype(self) -> str:
+        return 'qint8' if self.device == 'cpu' and self.conf.get('cpu_quantize_demucs', False) else 'float32'
+
+    def _parallel_whisper_settings(self):
+        """多进程转录的 (进程数, 每进程线程数)；仅在 CPU 上且 whisper_workers > 1 时启用，否则返回 None。"""
+        workers = int(self.conf.get('whisper_workers', 0) or 0)
+        if self.device != 'cpu' or workers <= 1:
+            return None
+        threads = int(self.conf.get('whisper_threads_per_worker', 0) or 0) or max(1, available_cpus() // workers)
+        return workers, threads
+
+    def _get_parallel_whisper(self):
+        settings = self._parallel_whisper_settings()
+        if settings is None:
+            return None
+        if self._parallel_whisper is None:
+            self._parallel_whisper = ParallelWhisper(self.whisper_model_name, *settings, *self._asr_settings())
+        return self._parallel_whisper
+
+    def _init_llm_client(self):
         self.llm_client = None
         if self.conf.get('use_deepseek') and self.conf.get('deepseek_api_key'):
             try:
-                self.llm_client = OpenAI(api_key=self.conf['deepseek_api_key'], base_url="https://api.deepseek.com")
+                self.llm_client = SubtitleRefiner.from_config(self.conf)
                 print("DeepSeek 客户端初始化成功。")
             except Exception as e:
                 print(f"警告: 初始化 DeepSeek 客户端失败: {e}")
-        
-        print("所有模型加载完毕，服务已就绪。")
 
     def _optimize_with_llm(self, segments: list) -> list:
-        # ... (此函数代码与您提供的版本相同，此处省略以保持简洁)
         if not self.llm_client or not segments: return segments
-        print(f"正在向 DeepSeek 发送 {len(segments)} 条字幕进行批量优化...")
-        original_texts = [seg['text'] for seg in segments]
-        prompt_content = """你是一个专业的字幕校对员。用户会提供一个JSON数组，其中包含由ASR生成的、可能存在识别错误且未加标点的句子。
-你的任务是：
-1. 逐句修正文本中的谐音或识别错误。
-2. 为每句话添加恰当的标点符号，使其通顺易读。
-3. 以一个JSON数组的形式返回处理后的结果，数组长度必须与输入完全一致。
-4. 不要合并或拆分句子，保持原始句子的数量。
-5. 只返回JSON数组，不要包含任何额外的解释或代码块标记。
-
-示例输入: ["how are you today", "im fine thank you"]
-示例输出: ["How are you today?", "I'm fine, thank you."]
-
-示例输入: ["今天天气真好我们去公园玩吧", "那里有很多花草"]
-示例输出: ["今天天气真好，我们去公园玩吧。", "那里有很多花草。"]
-"""
-        system_prompt = {"role": "system", "content": prompt_content}
-        user_prompt = {"role": "user", "content": json.dumps(original_texts, ensure_ascii=False)}
-        try:
-            response = self.llm_client.chat.completions.create(model="deepseek-chat", messages=[system_prompt, user_prompt], stream=False, temperature=0.2)
-            content = response.choices[0].message.content.strip()
-            if content.startswith("```json"): content = content[7:-4]
-            if content.startswith("`"): content = content.strip("`")
-            optimized_texts = json.loads(content)
-            if isinstance(optimized_texts, list) and len(optimized_texts) == len(segments):
-                for i, seg in enumerate(segments):
-                    if isinstance(optimized_texts[i], str) and optimized_texts[i].strip():
-                        seg['text'] = optimized_texts[i]
-                print("DeepSeek 批量优化成功。")
-                return segments
-            else:
-                print(f"警告: DeepSeek 返回格式不匹配 (返回 {len(optimized_texts)} 条, 预期 {len(segments)} 条)，将使用原始文本。")
-        except Exception as e:
-            print(f"调用 DeepSeek API 或解析结果失败，将使用原始文本: {e}")
-            traceback.print_exc()
+        print(f"正在向 DeepSeek 发送 {len(segments)} 条字幕进行分块优化...")
+        refined_texts = self.llm_client.refine([seg['text'] for seg in segments])
+        for seg, text in zip(segments, refined_texts):
+            seg['text'] = text
         return segments
 
 
-    def run(self, video_path: str, language: str = None, num_speakers: int = None, progress_handler=None) -> str:
-        # ... (此函数代码与您提供的版本相同，逻辑非常稳健，无需修改)
-        # ... (此处省略以保持简洁)
+    def _needs_separation(self, video_path: str, source_hash: str, metrics: PipelineMetrics) -> bool:
+        """
+        档位的 separation 为 auto 时先估计混音中的背景声，停顿处足够安静且没有明显低频伴奏才跳过 Demucs。
+        估计结果按输入文件缓存，阈值可随时调整而无需重新解码。
+        """
+        if self.profile['separation'] != 'auto':
+            return True
+        cache = self.artifact_cache
+        key = cache.make_key('background', source=source_hash)
+        with metrics.stage('background') as rec:
+            stats = cache.get_json(key)
+            rec['cached'] = stats is not None
+            if stats is None:
+                # 流式解码并抽样，长视频也不会整条读入内存
+                stats = estimate_background(iter_audio_chunks(video_path, MODEL_SAMPLE_RATE, 1), MODEL_SAMPLE_RATE)
+                cache.put_json(key, stats)
+            needed = (stats['floor_db'] > float(self.conf.get('auto_separation_floor_db', -25))
+                      or stats['low_ratio'] > float(self.conf.get('auto_separation_low_ratio', 0.05)))
+            rec.update(stats, separation=needed)
+        if not needed:
+            metrics.set_audio_seconds(stats['duration'])
+        print(f"背景声估计: 停顿电平 {stats['floor_db']} dB，低频占比 {stats['low_ratio']}，"
+              f"{'需要' if needed else '无需'}人声分离")
+        return needed
+
+    def _vocals_key(self, source_hash: str) -> str:
+        """Demucs 分离出的人声在中间产物缓存中的键，也是检查点中分离阶段的参数。"""
+        return self.artifact_cache.make_key('vocals', source=source_hash, model=DEMUCS_MODEL_NAME,
+                                            dtype=self._demucs_dtype())
+
+    def separate_vocals(self, video_path: str, progress_handler=None, metrics: PipelineMetrics = None) -> tuple:
+        """
+        步骤 1-2：提取音轨并用 Demucs 分离人声，结果存入中间产物缓存，返回 (缓存键, 人声文件路径)。
+        已有缓存时直接返回。批处理时可提前为下一个文件调用，使其与当前文件的推理重叠。
+        档位判定无需分离时不运行 Demucs，返回的路径就是原始文件。
+        """
+        update_progress = progress_handler or (lambda message: None)
+        metrics = metrics or PipelineMetrics(uuid.uuid4().hex, video_path, path=None)
         output_dir = Path("demucs_output")
         output_dir.mkdir(exist_ok=True)
+        cache = self.artifact_cache
+        source_hash = cache.file_digest(video_path)
+        vocals_key = self._vocals_key(source_hash)
+
+        update_progress("步骤 1/7: 提取音频...")
+        if not self._needs_separation(video_path, source_hash, metrics):
+            # 直接以原始文件作为"人声"，后续解码时由 ffmpeg 混为单声道并重采样
+            update_progress("步骤 2/7: 未检测到明显的背景声，跳过人声分离")
+            return cache.make_key('vocals', source=source_hash, model=None), Path(video_path)
+        with metrics.stage('separation') as rec:
+            vocals_path = cache.get_path(vocals_key, 'vocals.wav')
+            rec['cached'] = vocals_path is not None
+            rec['dtype'] = self._demucs_dtype()
+            if vocals_path is None:
+                sr = self.demucs_model.samplerate
+                channels = self.demucs_model.audio_channels
+                separated_path = output_dir / f"{Path(video_path).stem}_vocals.wav"
+                try:
+                    chunk_seconds = float(self.conf.get('demucs_chunk_seconds', 60))
+                    if chunk_seconds > 0:
+                        # 流式模式：ffmpeg 按块解码，Demucs 逐块分离，人声边算边写入磁盘
+                        update_progress(f"步骤 2/7: 分离人声 (Demucs，每块 {chunk_seconds:g} 秒)...")
+                        overlap_samples = int(float(self.conf.get('demucs_overlap_seconds', 5)) * sr)
+                        chunks = iter_audio_chunks(video_path, sr, channels, chunk_seconds)
+                        separate_vocals_streaming(
+                            self.demucs_model, chunks, separated_path, self.device, overlap_samples,
+                            progress=lambda seconds: update_progress(
+                                f"步骤 2/7: 分离人声 (Demucs，已处理 {seconds:.0f} 秒)..."))
+                    else:
+                        # ffmpeg 直接按 Demucs 需要的采样率与声道数解码到内存，不再写入临时 WAV
+                        waveform = torch.from_numpy(load_audio(video_path, sr, channels))
+                        update_progress("步骤 2/7: 分离人声 (Demucs)...")
+                        sources = apply_model(self.demucs_model, waveform.to(self.device).unsqueeze(0), split=True, device=self.device)
+                        del waveform
+                        vocals_source = sources[0, self.demucs_model.sources.index("vocals")].cpu()
+                        del sources
+                        sf.write(str(separated_path), vocals_source.T.numpy(), sr)
+                    vocals_path = cache.put_file(vocals_key, separated_path, 'vocals.wav')
+                except Exception:
+                    # 尚未移入缓存的临时文件没有复用价值
+                    if separated_path.exists(): separated_path.unlink()
+                    raise
+            else:
+                update_progress("步骤 2/7: 分离人声 (使用缓存)")
+            metrics.set_audio_seconds(sf.info(str(vocals_path)).duration)
+        return vocals_key, vocals_path
+
+    def stream(self, video_path: str, language: str = None, num_speakers: int = None, progress_handler=None,
+               job_id: str = None):
+        """
+        run() 的生成器形式：在后台线程中执行流水线，边转录边产出
+        ('segments', start_index, segments, final) 事件，结束时产出 ('done', 最终片段列表)。
+        流水线中的异常会在迭代方重新抛出。
+        """
+        events = queue.Queue()
+        def segment_handler(start_index, segments, final):
+            events.put(('segments', start_index, segments, final))
+        def target():
+            try:
+                events.put(('done', self.run(video_path, language, num_speakers, progress_handler, job_id,
+                                             segment_handler=segment_handler)))
+            except BaseException as e:
+                events.put(('error', e))
+        threading.Thread(target=target, name='subtitle-stream', daemon=True).start()
+        while True:
+            event = events.get()
+            if event[0] == 'error':
+                raise event[1]
+            yield event
+            if event[0] == 'done':
+                return
+
+    def resume(self, job_id: str, progress_handler=None, segment_handler=None) -> list:
+        """按检查点中记录的输入重新运行任务，已完成且校验通过的阶段直接复用。"""
+        inputs = JobCheckpoint(job_id).inputs
+        if not inputs:
+            raise ValueError(f"任务 {job_id} 没有可恢复的检查点。")
+        return self.run(inputs['video_path'], inputs['language'], inputs['num_speakers'], progress_handler,
+                        job_id=job_id, segment_handler=segment_handler)
+
+    def run(self, video_path: str, language: str = None, num_speakers: int = None, progress_handler=None,
+            job_id: str = None, segment_handler=None) -> list:
+        """
+        执行完整流水线，返回带说话人的片段列表 (格式见 to_public_segment)，字幕文件只在导出时生成。
+        给出 segment_handler 时按块转录，
+        每完成一块就通过 _SegmentStream 交出新片段，调用方无需等到全部步骤结束。
+        给出 job_id 时各阶段结果写入该任务的检查点，同一 job_id 再次运行会从最后完成的阶段继续。
+        """
+        metrics = PipelineMetrics(job_id or uuid.uuid4().hex, video_path,
+                                  path=self.conf.get('metrics_path') or DEFAULT_METRICS_PATH)
         def update_progress(message: str):
             if progress_handler: progress_handler(message)
             print(f"进度: {message}")
         try:
-            update_progress("步骤 1/7: 提取音频...")
-            with VideoFileClip(video_path) as video:
-                if video.audio is None: raise ValueError("视频文件不含音频。")
-                temp_audio_path = output_dir / f"{Path(video_path).stem}_audio.wav"
-                video.audio.write_audiofile(str(temp_audio_path), codec='pcm_s16le', logger=None)
-            waveform, sr = torchaudio.load(temp_audio_path)
-            update_progress("步骤 2/7: 分离人声 (Demucs)...")
-            if sr != self.demucs_model.samplerate:
-                waveform = torchaudio.transforms.Resample(sr, self.demucs_model.samplerate)(waveform)
-            sr = self.demucs_model.samplerate
-            if waveform.dim() == 1: waveform = waveform.unsqueeze(0)
-            if waveform.dim() > 2: waveform = waveform.mean(dim=0, keepdim=True)
-            sources = apply_model(self.demucs_model, waveform.to(self.device).unsqueeze(0), split=True, device=self.device)
-            vocals_source = sources[0, self.demucs_model.sources.index("vocals")].cpu()
-            vocals_path = output_dir / f"{Path(video_path).stem}_vocals.wav"
-            sf.write(str(vocals_path), vocals_source.T.numpy(), sr)
-            temp_audio_path.unlink()
-            update_progress("步骤 3/7: 识别说话人 (Pyannote)...")
+            cache = self.artifact_cache
+            # 检查点按任务保存；没有任务 ID 的调用 (例如基准测试) 不做检查点
+            checkpoint = JobCheckpoint(job_id) if job_id else None
+            if checkpoint: checkpoint.begin(video_path=str(video_path), language=language, num_speakers=num_speakers)
+            # 人声保存在任务自己的检查点目录中，中间产物缓存淘汰后恢复也不必重跑 Demucs
+            separation_params = {'vocals': self._vocals_key(cache.file_digest(video_path))}
+            vocals_path = checkpoint.load_file('separation', separation_params) if checkpoint else None
+            if vocals_path is not None:
+                vocals_key = separation_params['vocals']
+                update_progress("步骤 1-2/7: 从检查点恢复人声")
+                metrics.set_audio_seconds(sf.info(str(vocals_path)).duration)
+            else:
+                vocals_key, vocals_path = self.separate_vocals(video_path, update_progress, metrics)
+                # 档位判定无需分离时人声就是原始文件，没有需要保存的产物
+                if checkpoint and vocals_key == separation_params['vocals']:
+                    vocals_path = checkpoint.save_file('separation', separation_params, vocals_path)
+            # 步骤 3 与步骤 4 互不依赖，在两个线程中并行执行，直到步骤 5 才汇合
             diarization_params = {}
             if num_speakers and num_speakers > 0:
                 diarization_params['num_speakers'] = num_speakers
-                update_progress(f"步骤 3/7: 识别说话人 (Pyannote，指定 {num_speakers} 人)...")
+                diarization_label = f"识别说话人 (Pyannote，指定 {num_speakers} 人)"
             else:
                 # 如果不指定人数，可以给一个范围提示，这比完全自动检测要好
                 # diarization_params['min_speakers'] = 2
                 # diarization_params['max_speakers'] = 5
-                update_progress("步骤 3/7: 识别说话人 (Pyannote，自动检测人数)...")
-            diarization_result = self.diarization_pipeline(str(vocals_path), **diarization_params)
-            update_progress("步骤 4/7: 转录文本 (Whisper)...")
-            whisper_result = self.whisper_model.transcribe(str(vocals_path), language=language, fp16=torch.cuda.is_available())
-            vocals_path.unlink()
-            if not whisper_result.get("segments"): raise ValueError("Whisper 未检测到任何语音片段。")
-            update_progress("步骤 5/7: 匹配说话人与文本...")
-            final_segments = assign_speaker_to_whisper_segments(diarization_result, whisper_result["segments"])
+                diarization_label = "识别说话人 (Pyannote，自动检测人数)"
+            whisper_model_name = self.whisper_model_name
+            asr_backend, asr_dtype = self._asr_settings()
+            decode_options = dict(self.profile['decode_options'])
+            vad_params = self._vad_params()
+            diarization_key = cache.make_key('diarization', vocals=vocals_key, pipeline=DIARIZATION_PIPELINE_NAME,
+                                             params=diarization_params, vad=vad_params)
+            parallel_whisper = self._get_parallel_whisper()
+            # 分块转录的结果与整段转录略有差异，块长也参与缓存键的计算
+            if parallel_whisper:
+                whisper_chunk_seconds = float(self.conf.get('whisper_chunk_seconds', 120))
+            elif segment_handler:
+                whisper_chunk_seconds = float(self.conf.get('stream_chunk_seconds', 60))
+            else:
+                whisper_chunk_seconds = None
+            segment_stream = _SegmentStream(segment_handler) if segment_handler else None
+            transcript_key = cache.make_key('transcript', vocals=vocals_key, model=whisper_model_name, language=language,
+                                            vad=vad_params, chunk_seconds=whisper_chunk_seconds, decode=decode_options,
+                                            backend=asr_backend, dtype=asr_dtype)
+
+            def load_stage(stage: str, key: str):
+                """先查本任务的检查点，再查跨任务共享的中间产物缓存 (后者可能已被淘汰)。"""
+                data = checkpoint.load_json(stage, {'key': key}) if checkpoint else None
+                return data if data is not None else cache.get_json(key)
+            def save_stage(stage: str, key: str, data):
+                cache.put_json(key, data)
+                if checkpoint: checkpoint.save_json(stage, {'key': key}, data)
+
+            assignment_params = {'diarization': diarization_key, 'transcript': transcript_key}
+            final_segments = checkpoint.load_json('assignment', assignment_params) if checkpoint else None
+            if final_segments is not None:
+                update_progress("步骤 3-5/7: 从检查点恢复说话人与文本")
+            else:
+                # 人声只解码一次为 16 kHz 单声道，Pyannote 与 Whisper 共享同一块内存，不再各自读文件、重采样
+                audio, time_map = None, None
+                ready_turns = load_stage('diarization', diarization_key)
+                ready_transcript = load_stage('transcription', transcript_key)
+                needs_models = ready_turns is None or ready_transcript is None
+                if needs_models:
+                    with metrics.stage('decode'):
+                        audio = AudioBuffer.from_file(vocals_path)
+                # 语音活动检测：去掉静音与纯音乐段，只把拼接后的语音交给 Pyannote 和 Whisper，结果再映射回原时间轴
+                if vad_params and needs_models:
+                    with metrics.stage('vad') as rec:
+                        regions = detect_speech_regions(audio.samples, audio.sample_rate, **vad_params)
+                        total_seconds = audio.duration
+                        speech_seconds = sum(e - s for s, e in regions)
+                        rec['speech_ratio'] = round(speech_seconds / total_seconds, 4) if total_seconds else None
+                        if regions and speech_seconds < total_seconds * 0.98:
+                            audio = AudioBuffer(compact_audio(audio.samples, audio.sample_rate, regions))
+                            time_map = TimeMap(regions)
+                        update_progress(f"语音活动检测: 保留 {speech_seconds:.0f}/{total_seconds:.0f} 秒音频")
+                stage_status = {'3': '等待', '4': '等待'}
+                status_lock = threading.Lock()
+                def report_parallel(step: str, status: str):
+                    with status_lock:
+                        stage_status[step] = status
+                        update_progress(f"步骤 3-4/7: {diarization_label} [{stage_status['3']}] | 转录文本 (Whisper) [{stage_status['4']}]")
+
+                def diarize():
+                    with metrics.stage('diarization') as rec:
+                        turns = ready_turns
+                        rec['cached'] = turns is not None
+                        if turns is not None:
+                            report_parallel('3', '使用缓存')
+                            if segment_stream: segment_stream.set_turns(turns)
+                            return turns
+                        report_parallel('3', '进行中')
+                        turns = _diarization_turns(self.diarization_pipeline(audio.waveform(), **diarization_params))
+                        if time_map: turns = time_map.map_turns(turns)
+                        save_stage('diarization', diarization_key, turns)
+                        if segment_stream: segment_stream.set_turns(turns)
+                        report_parallel('3', '完成')
+                        return turns
+
+                def transcribe():
+                    with metrics.stage('transcription', model=whisper_model_name, profile=self.profile_name,
+                                       backend=asr_backend, dtype=asr_dtype) as rec:
+                        result = ready_transcript
+                        rec['cached'] = result is not None
+                        if result is not None:
+                            report_parallel('4', '使用缓存')
+                            if segment_stream: segment_stream.add(result['segments'])
+                            return result
+                        report_parallel('4', '进行中')
+                        def on_segments(segments):
+                            # 交出的是副本，映射回原时间轴不影响随后对完整结果的统一映射
+                            segments = copy.deepcopy(segments)
+                            if time_map: time_map.map_segments(segments)
+                            segment_stream.add(segments)
+                        if parallel_whisper:
+                            # 多进程模式：按静音切块，各进程独立转录后按全局时间戳拼接
+                            rec['workers'] = parallel_whisper.workers
+                            result = parallel_whisper.transcribe(
+                                audio.numpy(), language=language, chunk_seconds=whisper_chunk_seconds,
+                                progress=lambda done, total: report_parallel('4', f"{done}/{total} 块"),
+                                on_segments=on_segments if segment_stream else None, **decode_options)
+                        elif segment_stream:
+                            result = transcribe_chunked(self.asr_model, audio.numpy(), language=language,
+                                                        chunk_seconds=whisper_chunk_seconds, on_segments=on_segments,
+                                                        progress=lambda done, total: report_parallel('4', f"{done}/{total} 块"),
+                                                        **decode_options)
+                        else:
+                            result = self.asr_model.transcribe(audio.numpy(), language=language, **decode_options)
+                        if time_map: time_map.map_segments(result['segments'])
+                        save_stage('transcription', transcript_key, result)
+                        report_parallel('4', '完成')
+                        return result
+
+                with ThreadPoolExecutor(max_workers=2, thread_name_prefix='subtitle-stage') as pool:
+                    diarization_future = pool.submit(diarize)
+                    whisper_future = pool.submit(transcribe)
+                    try:
+                        diarization_result = diarization_future.result()
+                        whisper_result = whisper_future.result()
+                    except BaseException:
+                        # 一侧失败或任务被取消时，另一侧若尚未开始就不再执行；已在运行的一侧会在下一次汇报进度时停下
+                        whisper_future.cancel()
+                        diarization_future.cancel()
+                        raise
+                del audio
+                if not whisper_result.get("segments"): raise ValueError("Whisper 未检测到任何语音片段。")
+                update_progress("步骤 5/7: 匹配说话人与文本...")
+                with metrics.stage('assignment', segments=len(whisper_result["segments"])):
+                    final_segments = assign_speaker_to_whisper_segments(diarization_result, whisper_result["segments"])
+                if checkpoint: checkpoint.save_json('assignment', assignment_params, final_segments)
             if self.llm_client and self.conf.get('use_deepseek', False):
-                update_progress("步骤 6/7: DeepSeek 润色...")
-                final_segments = self._optimize_with_llm(final_segments)
-            update_progress("步骤 7/7: 生成 SRT 文件...")
-            srt_path = output_dir / f"{Path(video_path).stem}_subtitle.srt"
-            with open(srt_path, "w", encoding="utf-8") as f:
-                def format_time(t):
-                    if t is None or not isinstance(t, (int, float)): return "00:00:00,000"
-                    h, rem = divmod(t, 3600); m, s = divmod(rem, 60); ms = int((s - int(s)) * 1000)
-                    return f"{int(h):02}:{int(m):02}:{int(s):02},{ms:03}"
-                for i, segment in enumerate(final_segments):
-                    text = segment.get('text', '').strip()
-                    if not text: continue
-                    f.write(f"{i + 1}\n")
-                    f.write(f"{format_time(segment.get('start'))} --> {format_time(segment.get('end'))}\n")
-                    speaker = segment.get('speaker', '未知')
-                    f.write(f"{speaker}: {text}\n\n")
+                llm_params = {**assignment_params, 'model': self.conf.get('deepseek_model'),
+                              'base_url': self.conf.get('deepseek_base_url')}
+                refined = checkpoint.load_json('llm', llm_params) if checkpoint else None
+                if refined is not None:
+                    final_segments = refined
+                    update_progress("步骤 6/7: DeepSeek 润色 (从检查点恢复)")
+                else:
+                    update_progress("步骤 6/7: DeepSeek 润色...")
+                    with metrics.stage('llm') as rec:
+                        final_segments = self._optimize_with_llm(final_segments)
+                        stats = self.llm_client.last_stats
+                        rec.update(stats)
+                    if checkpoint: checkpoint.save_json('llm', llm_params, final_segments)
+                    update_progress(f"步骤 6/7: DeepSeek 润色完成 (缓存命中 {stats['cache_hits']}/{stats['total']} 条，"
+                                    f"失败 {stats['failed_chunks']} 块)")
+            update_progress("步骤 7/7: 整理字幕...")
+            result = [seg for seg in map(to_public_segment, final_segments) if seg['text']]
+            if segment_stream: segment_stream.finish(result)
+            self.last_run_info = {
+                'profile': self.profile_name,
+                'model': whisper_model_name,
+                'asr_backend': asr_backend,
+                'asr_dtype': asr_dtype,
+                'decode_options': decode_options,
+                'separation': 'demucs' if Path(vocals_path) != Path(video_path) else 'skipped',
+            }
+            # 成功结束后检查点不再需要；失败时保留，下次以同一任务 ID 运行即可从断点继续
+            if checkpoint: checkpoint.discard()
+            metrics.finish(**self.last_run_info)
             update_progress("完成！")
-            return str(srt_path)
+            return result
         except Exception as e:
+            metrics.finish(status='error')
             traceback.print_exc()
             update_progress(f"错误: {e}")
-            if 'vocals_path' in locals() and locals()['vocals_path'].exists():
-                locals()['vocals_path'].unlink()
             raise e
 
 # 移除模块级别的单例创建和本地测试入口
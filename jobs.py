@@ -0,0 +1,342 @@
+# jobs.py
+
+import json
+import time
+import uuid
+import sqlite3
+import traceback
+import multiprocessing
+from pathlib import Path
+from contextlib import contextmanager
+
+from checkpoint import JobCheckpoint, prune_checkpoints
+
+JOB_DB_PATH = Path('demucs_output/jobs.db')
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+CANCELLING = 'cancelling'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+# 已结束任务的字幕片段保留时长
+SEGMENT_RETENTION_SECONDS = 24 * 3600
+
+
+class JobCancelled(Exception):
+    """用户取消任务时，由进度回调在流水线内部抛出。"""
+
+
+class JobStore:
+    """
+    基于 SQLite 的持久化任务表。主进程与各个工作进程各自持有一个实例，
+    通过数据库本身的锁来协调，因此服务重启后排队中的任务不会丢失。
+    """
+    def __init__(self, db_path=JOB_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    video_path TEXT NOT NULL,
+                    language TEXT,
+                    num_speakers INTEGER,
+                    status TEXT NOT NULL,
+                    message TEXT,
+                    result_path TEXT,
+                    error TEXT,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    run_info TEXT
+                )
+            """)
+            if 'run_info' not in {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN run_info TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            # 运行中任务已转录出的片段，网页端据此边转录边展示；seq 单调递增，便于只取新变化的行
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_segments (
+                    job_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    start_time REAL,
+                    end_time REAL,
+                    speaker TEXT,
+                    text TEXT,
+                    words TEXT,
+                    PRIMARY KEY (job_id, idx)
+                )
+            """)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(job_segments)")}
+            if 'words' not in columns:
+                conn.execute("ALTER TABLE job_segments ADD COLUMN words TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_job_segments_seq ON job_segments (job_id, seq)")
+
+    @contextmanager
+    def _connect(self):
+        # 自动提交模式；每次操作使用短连接，避免跨进程长时间持有锁
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, video_path: str, language: str = None, num_speakers: int = None) -> str:
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, video_path, language, num_speakers, status, message, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, str(video_path), language, num_speakers, QUEUED, '排队中...', time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['run_info'] = json.loads(job['run_info']) if job.get('run_info') else None
+        return job
+
+    def queue_position(self, job_id: str) -> int:
+        """返回排队位置 (从 1 开始)；任务不在排队中时返回 0。"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at <= "
+                "(SELECT created_at FROM jobs WHERE id = ? AND status = ?)",
+                (QUEUED, job_id, QUEUED),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def cancel(self, job_id: str):
+        """排队中的任务直接取消；运行中的任务标记为取消中，由工作进程在下一个进度点中止。"""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                         (CANCELLED, time.time(), job_id, QUEUED))
+            conn.execute("UPDATE jobs SET status = ? WHERE id = ? AND status = ?",
+                         (CANCELLING, job_id, RUNNING))
+
+    def claim_next(self, worker: str):
+        """原子地领取最早的排队任务。"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE jobs SET status = ?, worker = ?, started_at = ?, message = ? WHERE id = ?",
+                                 (RUNNING, worker, time.time(), '开始处理...', row['id']))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = dict(row)
+        job['status'] = RUNNING
+        return job
+
+    def update_progress(self, job_id: str, message: str) -> str:
+        """记录进度消息，并返回任务当前状态，供工作进程检查是否被取消。"""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET message = ? WHERE id = ?", (message, job_id))
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row['status'] if row else CANCELLED
+
+    def put_segments(self, job_id: str, start_index: int, segments: list, final: bool = False):
+        """从 start_index 起写入 (覆盖) 片段；final 为 True 时删除其后多余的旧片段。"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM job_segments WHERE job_id = ?",
+                                   (job_id,)).fetchone()[0]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO job_segments (job_id, idx, seq, start_time, end_time, speaker, text, words) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(job_id, start_index + i, seq, seg['start'], seg['end'], seg['speaker'], seg['text'],
+                      json.dumps(seg['words'], ensure_ascii=False) if seg.get('words') else None)
+                     for i, seg in enumerate(segments)],
+                )
+                if final:
+                    conn.execute("DELETE FROM job_segments WHERE job_id = ? AND idx >= ?",
+                                 (job_id, start_index + len(segments)))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def get_segments(self, job_id: str, after_seq: int = 0) -> tuple:
+        """
+        返回 (seq 大于 after_seq 的片段行 (按 idx 排序), 当前最大 seq, 片段总数)。
+        任务完成后这里保存的就是最终结果，网页端据此构造字幕，不再经过 SRT 文件。
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT idx, seq, start_time, end_time, speaker, text, words FROM job_segments "
+                "WHERE job_id = ? AND seq > ? ORDER BY idx", (job_id, after_seq)).fetchall()
+            max_seq, total = conn.execute("SELECT COALESCE(MAX(seq), 0), COUNT(*) FROM job_segments WHERE job_id = ?",
+                                          (job_id,)).fetchone()
+        rows = [dict(row) for row in rows]
+        for row in rows:
+            row['words'] = json.loads(row['words']) if row['words'] else None
+        return rows, max_seq, total
+
+    def _finish(self, job_id: str, status: str, **fields):
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET status = ?, finished_at = ?{', ' if fields else ''}{assignments} WHERE id = ?",
+                         (status, time.time(), *fields.values(), job_id))
+
+    def mark_done(self, job_id: str, result_path: str = None, run_info: dict = None):
+        """run_info 记录任务实际使用的处理档位、模型、解码参数以及是否做了人声分离。"""
+        self._finish(job_id, DONE, result_path=result_path, message='完成！',
+                     run_info=json.dumps(run_info, ensure_ascii=False) if run_info else None)
+
+    def mark_failed(self, job_id: str, error: str):
+        self._finish(job_id, FAILED, error=error, message=f"错误: {error}")
+
+    def mark_cancelled(self, job_id: str):
+        self._finish(job_id, CANCELLED, message='已取消')
+
+    def requeue_interrupted(self) -> int:
+        """服务启动时调用：上次运行中被中断的任务重新排队，取消中的任务直接标记为已取消。"""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, finished_at = ?, message = ? WHERE status = ?",
+                         (CANCELLED, time.time(), '已取消', CANCELLING))
+            cur = conn.execute("UPDATE jobs SET status = ?, worker = NULL, message = ? WHERE status = ?",
+                               (QUEUED, '服务重启，重新排队...', RUNNING))
+            # 重新排队的任务会从头产出片段；已结束超过一天的任务结果不再保留
+            conn.execute("DELETE FROM job_segments WHERE job_id IN (SELECT id FROM jobs WHERE status = ?)", (QUEUED,))
+            conn.execute("DELETE FROM job_segments WHERE job_id IN (SELECT id FROM jobs WHERE finished_at < ?)",
+                         (time.time() - SEGMENT_RETENTION_SECONDS,))
+        return cur.rowcount
+
+
+def _worker_main(worker_name: str, db_path: str, stop_event, worker_index: int = 0, num_workers: int = 1):
+    """工作进程入口：按配置绑核并限制线程数，加载自己的一套模型，然后循环领取并执行任务。"""
+    # 在子进程中导入，避免主进程加载 torch 与模型
+    from config import get_config
+    from cpu_tuning import apply_cpu_limits
+    from get_subtitle import SubtitleGenerator
+
+    store = JobStore(db_path)
+    generator, init_error = None, None
+    try:
+        config = get_config()
+        # 线程数与绑核在进程启动时设置一次，修改后需要重启服务
+        limits = apply_cpu_limits(config, worker_index, num_workers)
+        print(f"[{worker_name}] torch 线程数 {limits['threads']} (inter-op {limits['interop_threads']})"
+              + (f"，绑定核心 {limits['cores']}" if 'cores' in limits else ""))
+        generator = SubtitleGenerator(config=config)
+        if config.get('prewarm_models', True):
+            # 工作进程启动时服务已在接受请求，模型在后台线程中预热
+            generator.prewarm()
+    except Exception as e:
+        traceback.print_exc()
+        init_error = f"模型加载失败: {e}"
+        print(f"[{worker_name}] {init_error}")
+
+    while not stop_event.is_set():
+        job = store.claim_next(worker_name)
+        if job is None:
+            stop_event.wait(1.0)
+            continue
+        job_id = job['id']
+        print(f"[{worker_name}] 开始处理任务 {job_id}: {job['video_path']}")
+        if init_error:
+            store.mark_failed(job_id, init_error)
+            continue
+        # 每个任务开始前重新读取配置，设置页面修改的 Whisper 模型无需重启即可生效
+        generator.update_config(get_config())
+
+        cancelled = False
+        def progress_handler(message: str):
+            nonlocal cancelled
+            if store.update_progress(job_id, message) == CANCELLING:
+                cancelled = True
+                # 说话人分离与转录在两个线程中各自汇报进度，每次都要抛出，另一个线程才会在下一块处停下；
+                # 流水线失败时最后的错误消息不再抛出，以免掩盖原始异常
+                if not message.startswith("错误:"):
+                    raise JobCancelled()
+
+        try:
+            # 最终结果由 segment_handler 作为最后一批片段写入 job_segments
+            generator.run(job['video_path'], job['language'], job['num_speakers'], progress_handler, job_id=job_id,
+                          segment_handler=lambda start, segments, final: store.put_segments(job_id, start, segments, final))
+            store.mark_done(job_id, run_info=generator.last_run_info)
+        except JobCancelled:
+            store.mark_cancelled(job_id)
+            JobCheckpoint(job_id).discard()
+        except Exception as e:
+            if cancelled:
+                store.mark_cancelled(job_id)
+                JobCheckpoint(job_id).discard()
+            else:
+                # 失败任务的检查点保留下来，重新排队或 SubtitleGenerator.resume 时从断点继续
+                store.mark_failed(job_id, str(e))
+
+
+class JobQueue:
+    """
+    主进程侧的任务队列：负责提交、查询、取消任务，并管理固定数量的工作进程。
+    每个工作进程独立加载模型，任务之间互不共享模型对象。
+    """
+    def __init__(self, num_workers: int = 1, db_path=JOB_DB_PATH):
+        self.num_workers = max(1, int(num_workers))
+        self.db_path = Path(db_path)
+        self.store = JobStore(self.db_path)
+        self._ctx = multiprocessing.get_context('spawn')
+        self._stop_event = None
+        self._workers = []
+
+    def start(self):
+        # 重新排队的任务沿用原来的任务 ID，工作进程会从它们的检查点继续
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            print(f"已将 {requeued} 个中断的任务重新排队。")
+        pruned = prune_checkpoints()
+        if pruned:
+            print(f"已清理 {pruned} 个过期的任务检查点。")
+        self._stop_event = self._ctx.Event()
+        for i in range(self.num_workers):
+            name = f"worker-{i}"
+            # 工作进程内部还可能创建子进程，因此不能设为 daemon
+            proc = self._ctx.Process(target=_worker_main, name=name,
+                                     args=(name, str(self.db_path), self._stop_event, i, self.num_workers))
+            proc.start()
+            self._workers.append(proc)
+        print(f"已启动 {self.num_workers} 个字幕生成工作进程。")
+
+    def stop(self, timeout: float = 5.0):
+        if self._stop_event is not None:
+            self._stop_event.set()
+        for proc in self._workers:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+        self._workers = []
+
+    def submit(self, video_path: str, language: str = None, num_speakers: int = None) -> str:
+        return self.store.submit(video_path, language, num_speakers)
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    def queue_position(self, job_id: str) -> int:
+        return self.store.queue_position(job_id)
+
+    def get_segments(self, job_id: str, after_seq: int = 0) -> tuple:
+        return self.store.get_segments(job_id, after_seq)
+
+    def cancel(self, job_id: str):
+        self.store.cancel(job_id)
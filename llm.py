@@ -0,0 +1,252 @@
+# llm.py
+
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import traceback
+from pathlib import Path
+from contextlib import contextmanager
+from openai import AsyncOpenAI
+
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+DEFAULT_MODEL = "deepseek-chat"
+DEFAULT_CACHE_PATH = Path('demucs_output/llm_cache.db')
+# 修改 SYSTEM_PROMPT 时递增，使旧的缓存结果自动失效
+PROMPT_VERSION = 2
+
+SYSTEM_PROMPT = """你是一个专业的字幕校对员。用户会提供一个JSON对象，其中 "sentences" 是由ASR生成的、可能存在识别错误且未加标点的句子，"context" 是紧挨在它们之前的几句字幕，仅供理解上下文。
+你的任务是：
+1. 逐句修正 "sentences" 中的谐音或识别错误。
+2. 为每句话添加恰当的标点符号，使其通顺易读。
+3. 以一个JSON数组的形式返回处理后的 "sentences"，数组长度必须与 "sentences" 完全一致。
+4. 不要合并或拆分句子，保持原始句子的数量；不要返回 "context" 中的句子。
+5. 只返回JSON数组，不要包含任何额外的解释或代码块标记。
+
+示例输入: {"context": [], "sentences": ["how are you today", "im fine thank you"]}
+示例输出: ["How are you today?", "I'm fine, thank you."]
+
+示例输入: {"context": ["今天天气真好，我们去公园玩吧。"], "sentences": ["那里有很多花草"]}
+示例输出: ["那里有很多花草。"]
+"""
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中日韩字符按 1 个 token 计，其余字符按 4 个字符 1 个 token 计。"""
+    cjk = sum(1 for ch in text if '\u2e80' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7af')
+    return cjk + (len(text) - cjk + 3) // 4 + 1
+
+def build_chunks(texts: list, max_tokens: int) -> list:
+    """按 token 预算把句子切分为连续的 (start, end) 区间，每块至少包含一句。"""
+    chunks = []
+    start, budget = 0, 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if i > start and budget + cost > max_tokens:
+            chunks.append((start, i))
+            start, budget = i, 0
+        budget += cost
+    if start < len(texts):
+        chunks.append((start, len(texts)))
+    return chunks
+
+def _parse_response(content: str, expected: int):
+    content = content.strip()
+    if content.startswith("```json"): content = content[7:]
+    content = content.strip().strip("`").strip()
+    result = json.loads(content)
+    if not isinstance(result, list) or len(result) != expected:
+        got = len(result) if isinstance(result, list) else type(result).__name__
+        raise ValueError(f"返回格式不匹配 (返回 {got} 条, 预期 {expected} 条)")
+    return result
+
+
+class RefineCache:
+    """
+    LLM 润色结果的持久化缓存 (SQLite)，以 (模型名, 提示词版本, 原文) 的哈希为键逐句缓存。
+    超过 ttl_seconds 的条目视为过期；条目数超过 max_entries 时按最近访问时间淘汰。
+    """
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, ttl_seconds: float = 30 * 86400, max_entries: int = 100000):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS refinements (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_refinements_accessed ON refinements (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{PROMPT_VERSION}\x00{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: list) -> dict:
+        """批量查询，返回 {键: 润色结果}，只包含未过期的命中项，并刷新其访问时间。"""
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._connect() as conn:
+            unique = list(dict.fromkeys(keys))
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, value FROM refinements WHERE created_at >= ? AND key IN ({placeholders})",
+                    (now - self.ttl_seconds, *batch),
+                ).fetchall()
+                found.update(rows)
+            if found:
+                conn.executemany("UPDATE refinements SET accessed_at = ? WHERE key = ?", [(now, k) for k in found])
+        return found
+
+    def put_many(self, items: dict):
+        if not items:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO refinements (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(k, v, now, now) for k, v in items.items()],
+            )
+        self.evict()
+
+    def evict(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM refinements WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            count = conn.execute("SELECT COUNT(*) FROM refinements").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM refinements WHERE key IN "
+                    "(SELECT key FROM refinements ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+
+class SubtitleRefiner:
+    """
+    使用 OpenAI 兼容接口 (默认 DeepSeek) 对字幕进行校对与加标点。
+
+    句子按 token 预算切块，每块附带前几句作为上下文，通过异步客户端并发发送；
+    并发数、单次超时和指数退避重试次数均可配置。每块单独校验，
+    某一块失败只会让该块保留原文，不影响其他块。
+    """
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL, model: str = DEFAULT_MODEL,
+                 chunk_tokens: int = 1500, context_segments: int = 2, max_concurrency: int = 4,
+                 timeout: float = 60.0, max_retries: int = 3, cache: RefineCache = None):
+        self.api_key = api_key
+        self.base_url = base_url or DEFAULT_BASE_URL
+        self.model = model or DEFAULT_MODEL
+        self.chunk_tokens = chunk_tokens
+        self.context_segments = context_segments
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.cache = cache
+        # 最近一次 refine 的统计信息，供进度消息展示
+        self.last_stats = {'total': 0, 'cache_hits': 0, 'failed_chunks': 0}
+
+    @classmethod
+    def from_config(cls, conf: dict):
+        return cls(
+            api_key=conf['deepseek_api_key'],
+            base_url=conf.get('deepseek_base_url') or DEFAULT_BASE_URL,
+            model=conf.get('deepseek_model') or DEFAULT_MODEL,
+            chunk_tokens=int(conf.get('llm_chunk_tokens', 1500)),
+            max_concurrency=int(conf.get('llm_max_concurrency', 4)),
+            timeout=float(conf.get('llm_timeout', 60)),
+            max_retries=int(conf.get('llm_max_retries', 3)),
+            cache=RefineCache(
+                conf.get('llm_cache_path') or DEFAULT_CACHE_PATH,
+                ttl_seconds=float(conf.get('llm_cache_ttl_days', 30)) * 86400,
+                max_entries=int(conf.get('llm_cache_max_entries', 100000)),
+            ) if conf.get('llm_cache_enabled', True) else None,
+        )
+
+    async def _refine_chunk(self, client, semaphore, context: list, texts: list):
+        payload = json.dumps({"context": context, "sentences": texts}, ensure_ascii=False)
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": payload}]
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    response = await asyncio.wait_for(
+                        client.chat.completions.create(model=self.model, messages=messages, stream=False, temperature=0.2),
+                        timeout=self.timeout,
+                    )
+                return _parse_response(response.choices[0].message.content, len(texts))
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    print(f"警告: 字幕块润色失败 ({len(texts)} 条)，将保留原文: {e}")
+                    return None
+                delay = min(30.0, 2 ** attempt) + random.uniform(0, 0.5)
+                print(f"字幕块润色失败，{delay:.1f} 秒后重试 ({attempt + 1}/{self.max_retries}): {e}")
+                await asyncio.sleep(delay)
+
+    async def refine_async(self, texts: list) -> list:
+        """返回与 texts 等长的列表；润色失败或结果为空的句子保留原文。"""
+        self.last_stats = {'total': len(texts), 'cache_hits': 0, 'failed_chunks': 0}
+        if not texts:
+            return []
+        refined = list(texts)
+        keys = [RefineCache.make_key(self.model, t) for t in texts] if self.cache else []
+        cached = await asyncio.to_thread(self.cache.get_many, keys) if self.cache else {}
+        pending = []
+        for i, text in enumerate(texts):
+            if self.cache and keys[i] in cached:
+                refined[i] = cached[keys[i]]
+            else:
+                pending.append(i)
+        self.last_stats['cache_hits'] = len(texts) - len(pending)
+        if not pending:
+            print(f"LLM 润色全部命中缓存 ({len(texts)} 条)。")
+            return refined
+
+        # 只对未命中的句子分块；上下文仍取原始列表中紧邻的前几句
+        chunks = [pending[s:e] for s, e in build_chunks([texts[i] for i in pending], self.chunk_tokens)]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0) as client:
+            tasks = [
+                self._refine_chunk(client, semaphore, texts[max(0, idx[0] - self.context_segments):idx[0]],
+                                   [texts[i] for i in idx])
+                for idx in chunks
+            ]
+            results = await asyncio.gather(*tasks)
+        new_entries = {}
+        for idx, result in zip(chunks, results):
+            if result is None:
+                self.last_stats['failed_chunks'] += 1
+                continue
+            for i, text in zip(idx, result):
+                if isinstance(text, str) and text.strip():
+                    refined[i] = text
+                    if self.cache:
+                        new_entries[keys[i]] = text
+        if self.cache:
+            await asyncio.to_thread(self.cache.put_many, new_entries)
+        print(f"LLM 润色完成: 缓存命中 {self.last_stats['cache_hits']} 条，请求 {len(chunks)} 块，"
+              f"失败 {self.last_stats['failed_chunks']} 块。")
+        return refined
+
+    def refine(self, texts: list) -> list:
+        try:
+            return asyncio.run(self.refine_async(texts))
+        except Exception as e:
+            print(f"调用 LLM 润色失败，将使用原始文本: {e}")
+            traceback.print_exc()
+            return list(texts)
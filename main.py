@@ -3,6 +3,7 @@
 import os
 import sys
 import atexit
+import multiprocessing
 import traceback
 from pathlib import Path
 from typing import Union  # 关键改动 1: 导入 Union
@@ -11,13 +12,14 @@ from nicegui import app, ui, Client
 
 # --- 从我们自己的模块导入 ---
 from config import get_config, is_config_valid
-from get_subtitle import SubtitleGenerator
+from jobs import JobQueue
+from metrics import MetricsExporter, DEFAULT_METRICS_PATH
 from webui import main_page, settings_page
 
 # --- 全局变量 ---
 app_config = {}
 # 关键改动 2: 使用 Union 替代 |
-subtitle_generator: Union[SubtitleGenerator, None] = None
+job_queue: Union[JobQueue, None] = None
 
 # --- 重启逻辑 ---
 RESTART_FILE = Path("restart.flag")
@@ -33,21 +35,33 @@ def check_for_restart():
 
 # --- 启动流程 ---
 def initialize_app():
-    global subtitle_generator, app_config
+    global job_queue, app_config
     app_config = get_config()
     
     if is_config_valid(app_config):
         try:
-            print("配置有效，正在初始化字幕生成器...")
-            subtitle_generator = SubtitleGenerator(config=app_config)
-            print("字幕生成器初始化成功。")
+            # 模型由各个工作进程自行加载，主进程只负责界面与任务调度
+            print("配置有效，正在初始化任务队列...")
+            job_queue = JobQueue(num_workers=app_config.get('num_workers', 1))
+            app.on_startup(job_queue.start)
+            app.on_shutdown(job_queue.stop)
         except Exception as e:
-            print(f"!!! 致命错误：模型加载失败，应用无法启动 !!!", file=sys.stderr)
+            print(f"!!! 致命错误：任务队列初始化失败，应用无法启动 !!!", file=sys.stderr)
             traceback.print_exc()
-            subtitle_generator = None
+            job_queue = None
     else:
         print("配置无效或不完整。将仅启动设置页面。")
-        subtitle_generator = None
+        job_queue = None
+
+# --- 监控指标 ---
+def register_metrics_endpoint(config: dict):
+    """以 Prometheus 文本格式暴露各阶段的耗时与资源占用统计。"""
+    from fastapi.responses import PlainTextResponse
+    exporter = MetricsExporter(config.get('metrics_path') or DEFAULT_METRICS_PATH)
+
+    @app.get('/metrics', response_class=PlainTextResponse)
+    def metrics_endpoint():
+        return PlainTextResponse(exporter.render(), media_type='text/plain; version=0.0.4')
 
 # --- NiceGUI 页面定义 ---
 @ui.page('/')
@@ -55,23 +69,24 @@ async def index_page(client: Client):
     await client.connected()
     check_for_restart()
 
-    if not subtitle_generator:
+    if not job_queue:
         ui.navigate.to('/settings')
         with ui.column().classes('w-full h-screen flex items-center justify-center'):
             ui.label("配置无效，正在跳转到设置页面...").classes("text-2xl m-4")
         return
     
-    main_page(subtitle_generator=subtitle_generator, app_config=app_config)
+    main_page(job_queue=job_queue, app_config=app_config)
 
 @ui.page('/settings')
 async def settings_route(client: Client):
     await client.connected()
     check_for_restart()
-    settings_page(restart_func=request_restart)
+    settings_page(restart_func=request_restart, hot_reload=job_queue is not None)
 
 
 # --- 主程序入口 ---
-if __name__ in {"__main__", "__mp_main__"}:
+# 工作进程以 spawn 方式启动时会重新导入本模块，只有主进程才启动服务
+if __name__ in {"__main__", "__mp_main__"} and multiprocessing.current_process().name == 'MainProcess':
     load_dotenv()
     STORAGE_SECRET = os.getenv("STORAGE_SECRET")
     if not STORAGE_SECRET:
@@ -84,6 +99,8 @@ if __name__ in {"__main__", "__mp_main__"}:
     app.add_media_files('/video', './cache')
     
     initialize_app()
+    if app_config.get('metrics_endpoint', True):
+        register_metrics_endpoint(app_config)
     
     atexit.register(lambda: RESTART_FILE.unlink(missing_ok=True))
     
@@ -0,0 +1,227 @@
+# metrics.py
+
+import os
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_METRICS_PATH = Path('demucs_output/metrics.jsonl')
+
+def _process_peak_rss_mb():
+    """进程启动以来的峰值常驻内存 (MB)，无法反映单个阶段。"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class _RssSampler:
+    """
+    有阶段在运行时，后台线程每隔 interval 秒采样一次当前 RSS，记录每个阶段运行期间的最大值。
+    ru_maxrss 是整个进程生命周期的峰值，最重的阶段之后每个阶段都会报告同一个数，无法定位内存瓶颈。
+    RSS 按进程统计，并行运行的阶段会互相计入对方的内存。
+    """
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        token = object()
+        rss = _current_rss_mb()
+        with self._lock:
+            self._active[token] = rss
+            if rss is not None and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='metrics-rss', daemon=True)
+                self._thread.start()
+        return token
+
+    def stop(self, token):
+        """结束采样并返回该阶段的峰值 RSS (MB)；无法读取 RSS 的平台返回 None。"""
+        rss = _current_rss_mb()
+        with self._lock:
+            peak = self._active.pop(token, None)
+        if peak is None or rss is None:
+            return None
+        return max(peak, rss)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            rss = _current_rss_mb()
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                for token, peak in self._active.items():
+                    if peak is not None and rss is not None and rss > peak:
+                        self._active[token] = rss
+
+_rss_sampler = _RssSampler()
+
+def _torch_threads():
+    torch = sys.modules.get('torch')
+    return torch.get_num_threads() if torch is not None else None
+
+
+class PipelineMetrics:
+    """
+    记录一次字幕生成任务中各阶段的耗时与资源占用，每个阶段结束时向 JSON Lines 文件追加一条记录。
+
+    记录字段: 墙钟时间、进程 CPU 时间、当前 RSS、阶段内采样到的峰值 RSS、进程生命周期峰值 RSS、torch 线程数，以及实时率
+    (rtf = 处理的音频秒数 / 墙钟秒数，大于 1 表示快于实时)。
+    并行执行的阶段各自计时，但 CPU 时间按进程统计，会包含同时运行的其他阶段。
+    """
+    def __init__(self, job_id: str, video_path: str = None, path=DEFAULT_METRICS_PATH):
+        self.job_id = job_id
+        self.video_path = video_path
+        self.path = Path(path) if path else None
+        self.audio_seconds = None
+        self.records = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+
+    def set_audio_seconds(self, seconds: float):
+        self.audio_seconds = seconds
+
+    @contextmanager
+    def stage(self, name: str, **extra):
+        """
+        用法: with metrics.stage('diarization') as rec: ...
+        rec 是一个字典，可在阶段内补充字段 (例如 rec['cached'] = True)。
+        """
+        record = dict(extra)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        rss_token = _rss_sampler.start()
+        status = 'ok'
+        try:
+            yield record
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            wall = time.perf_counter() - wall_start
+            self._emit({
+                'stage': name,
+                'status': status,
+                'wall_seconds': round(wall, 4),
+                'cpu_seconds': round(time.process_time() - cpu_start, 4),
+                'rss_mb': _current_rss_mb(),
+                'peak_rss_mb': _rss_sampler.stop(rss_token),
+                'process_peak_rss_mb': _process_peak_rss_mb(),
+                'torch_threads': _torch_threads(),
+                'audio_seconds': self.audio_seconds,
+                'rtf': round(self.audio_seconds / wall, 3) if self.audio_seconds and wall > 0 else None,
+                **record,
+            })
+
+    def finish(self, status: str = 'ok', **extra):
+        """写入整个任务的汇总记录；extra 为附加字段 (例如本次使用的处理档位)。"""
+        wall = time.perf_counter() - self._started
+        stage_peaks = [rec['peak_rss_mb'] for rec in self.records if rec.get('peak_rss_mb') is not None]
+        self._emit({
+            'stage': 'total',
+            'status': status,
+            'wall_seconds': round(wall, 4),
+            'cpu_seconds': round(time.process_time() - self._cpu_started, 4),
+            'rss_mb': _current_rss_mb(),
+            'peak_rss_mb': max(stage_peaks) if stage_peaks else None,
+            'process_peak_rss_mb': _process_peak_rss_mb(),
+            'torch_threads': _torch_threads(),
+            'audio_seconds': self.audio_seconds,
+            'rtf': round(self.audio_seconds / wall, 3) if self.audio_seconds and wall > 0 else None,
+            **extra,
+        })
+
+    def _emit(self, record: dict):
+        record = {'ts': time.time(), 'job_id': self.job_id, 'video': self.video_path, **record}
+        with self._lock:
+            self.records.append(record)
+            if self.path is None:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class MetricsExporter:
+    """
+    增量读取 metrics.jsonl 并汇总为 Prometheus 文本格式。
+    记录由各个工作进程写入，主进程只需记住已读到的文件偏移量。
+    """
+    def __init__(self, path=DEFAULT_METRICS_PATH):
+        self.path = Path(path)
+        self._offset = 0
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._errors = {}
+        self._wall = {}
+        self._cpu = {}
+        self._audio = {}
+        self._last_rtf = {}
+        self._peak_rss = {}
+
+    def _consume(self):
+        if not self.path.exists():
+            return
+        if self.path.stat().st_size < self._offset:
+            self._offset = 0  # 文件被截断或轮转
+        with open(self.path, 'r', encoding='utf-8') as f:
+            f.seek(self._offset)
+            while True:
+                line = f.readline()
+                if not line or not line.endswith("\n"):
+                    break  # 末尾可能是正在写入的半行，留到下次再读
+                self._offset = f.tell()
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                stage = rec.get('stage', 'unknown')
+                self._runs[stage] = self._runs.get(stage, 0) + 1
+                if rec.get('status') != 'ok':
+                    self._errors[stage] = self._errors.get(stage, 0) + 1
+                self._wall[stage] = self._wall.get(stage, 0.0) + (rec.get('wall_seconds') or 0.0)
+                self._cpu[stage] = self._cpu.get(stage, 0.0) + (rec.get('cpu_seconds') or 0.0)
+                if rec.get('status') == 'ok' and rec.get('audio_seconds') and not rec.get('cached'):
+                    self._audio[stage] = self._audio.get(stage, 0.0) + rec['audio_seconds']
+                if rec.get('status') == 'ok' and rec.get('rtf') is not None and not rec.get('cached'):
+                    self._last_rtf[stage] = rec['rtf']
+                if rec.get('peak_rss_mb') is not None:
+                    self._peak_rss[stage] = max(self._peak_rss.get(stage, 0.0), rec['peak_rss_mb'])
+
+    def render(self) -> str:
+        with self._lock:
+            self._consume()
+            lines = []
+            def emit(name, kind, help_text, values, scale=1.0):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for stage, value in sorted(values.items()):
+                    lines.append(f'{name}{{stage="{stage}"}} {value * scale:.6g}')
+            emit('subtitle_stage_runs_total', 'counter', 'Number of completed stage runs.', self._runs)
+            emit('subtitle_stage_errors_total', 'counter', 'Number of stage runs that raised an error.', self._errors)
+            emit('subtitle_stage_wall_seconds_total', 'counter', 'Wall-clock time spent per stage.', self._wall)
+            emit('subtitle_stage_cpu_seconds_total', 'counter', 'Process CPU time spent per stage.', self._cpu)
+            emit('subtitle_stage_audio_seconds_total', 'counter', 'Audio seconds processed per stage (cache hits excluded).', self._audio)
+            emit('subtitle_stage_last_rtf', 'gauge', 'Real-time factor of the most recent uncached run.', self._last_rtf)
+            emit('subtitle_stage_peak_rss_bytes', 'gauge', 'Highest RSS sampled while a stage was running.', self._peak_rss, scale=1024 * 1024)
+            return "\n".join(lines) + "\n"
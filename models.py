@@ -0,0 +1,99 @@
+# models.py
+
+import threading
+import traceback
+
+def _load_demucs(name: str, device: str, dtype: str = 'float32', **kwargs):
+    from demucs.pretrained import get_model
+    model = get_model(name).to(device)
+    model.eval()
+    if dtype == 'qint8':
+        from cpu_tuning import quantize_linear_int8
+        model = quantize_linear_int8(model)
+    return model
+
+def _asr_loader(backend: str):
+    # 语音识别模型按后端区分类型，切换后端时可以整类卸载
+    def load(name: str, device: str, dtype: str = None, **kwargs):
+        from asr import create_backend
+        return create_backend(backend, name, device, dtype=dtype, **kwargs)
+    return load
+
+def _load_diarization(name: str, device: str, hf_token: str = None, **kwargs):
+    import torch
+    from pyannote.audio import Pipeline
+    return Pipeline.from_pretrained(name, use_auth_token=hf_token).to(torch.device(device))
+
+LOADERS = {
+    'demucs': _load_demucs,
+    'openai-whisper': _asr_loader('openai-whisper'),
+    'faster-whisper': _asr_loader('faster-whisper'),
+    'diarization': _load_diarization,
+}
+
+
+class ModelRegistry:
+    """
+    进程内的模型注册表：首次使用时才加载模型，并按 (类型, 名称, 设备, 精度) 缓存。
+    每个键有独立的锁，多个线程同时请求同一模型时只会加载一次。
+    """
+    def __init__(self):
+        self._models = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, kind: str, name: str, device: str, dtype: str = 'float32', **load_kwargs):
+        key = (kind, name, device, dtype)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._key_lock(key):
+            model = self._models.get(key)
+            if model is None:
+                print(f"正在加载模型: {kind}/{name} ({device}, {dtype})...")
+                model = LOADERS[kind](name, device, dtype=dtype, **load_kwargs)
+                self._models[key] = model
+                print(f"模型加载完毕: {kind}/{name}")
+        return model
+
+    def register(self, kind: str, name: str, device: str, model, dtype: str = 'float32'):
+        """直接放入一个已构造的模型实例 (例如基准测试中的桩模型)。"""
+        self._models[(kind, name, device, dtype)] = model
+
+    def is_loaded(self, kind: str, name: str, device: str, dtype: str = 'float32') -> bool:
+        return (kind, name, device, dtype) in self._models
+
+    def evict(self, kind: str, keep_name: str = None):
+        """卸载某类模型中除 keep_name 以外的所有实例，用于热切换后释放内存。"""
+        with self._lock:
+            stale = [k for k in self._models if k[0] == kind and k[1] != keep_name]
+            for key in stale:
+                del self._models[key]
+                print(f"已卸载模型: {key[0]}/{key[1]}")
+        if stale:
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            except ImportError:
+                pass
+
+    def prewarm(self, loaders: list) -> threading.Thread:
+        """在后台线程中依次执行加载函数，提前把模型载入内存。加载失败只打印日志。"""
+        def run():
+            for load in loaders:
+                try:
+                    load()
+                except Exception:
+                    traceback.print_exc()
+        thread = threading.Thread(target=run, name='model-prewarm', daemon=True)
+        thread.start()
+        return thread
+
+
+# 进程级共享的默认注册表
+registry = ModelRegistry()
@@ -0,0 +1,204 @@
+# parallel_whisper.py
+
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from cpu_tuning import available_cpus
+
+WHISPER_SAMPLE_RATE = 16000
+
+# --- 切分 ---
+def plan_chunks(wave: np.ndarray, sample_rate: int, target_seconds: float, search_seconds: float = None,
+                frame_ms: float = 30.0, min_pause: float = 0.6, margin_db: float = 10.0) -> list:
+    """
+    把音频切成约 target_seconds 长的若干块，返回 (start_sample, end_sample) 列表。
+    每个切点在目标位置前后 search_seconds 的范围内找至少 min_pause 秒的连续静音，切在离目标最近的一段的中点，
+    避免把一句话切断；范围内没有明显比周围安静的停顿时才直接切在目标位置。
+    """
+    n = len(wave)
+    target = int(target_seconds * sample_rate)
+    if n <= target * 1.25:
+        return [(0, n)]
+    search = int((search_seconds if search_seconds is not None else target_seconds / 4) * sample_rate)
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = n // frame
+    frames = wave[:n_frames * frame].reshape(n_frames, frame)
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    pause_frames = max(1, int(round(min_pause * 1000 / frame_ms)))
+
+    chunks, start = [], 0
+    while n - start > target * 1.25:
+        lo = (start + target - search) // frame
+        hi = min(n_frames, (start + target + search) // frame + 1)
+        window = energy_db[lo:hi]
+        target_frame = (start + target) // frame - lo
+        cut = start + target
+        if len(window) >= pause_frames:
+            # 最安静的一段 min_pause 长的停顿决定静音阈值；它必须明显低于窗口的典型电平，否则视为没有停顿
+            loudest = np.lib.stride_tricks.sliding_window_view(window, pause_frames).max(axis=1)
+            threshold = loudest.min() + margin_db
+            if threshold < np.median(window):
+                edges = np.diff(np.concatenate(([0], (window <= threshold).astype(np.int8), [0])))
+                starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+                long_enough = ends - starts >= pause_frames
+                middles = (starts[long_enough] + ends[long_enough]) // 2
+                best = int(middles[np.argmin(np.abs(middles - target_frame))])
+                cut = (lo + best) * frame + frame // 2
+        chunks.append((start, cut))
+        start = cut
+    chunks.append((start, n))
+    return chunks
+
+# --- 工作进程 ---
+_worker_model = None
+
+def _init_worker(model_name: str, threads: int, backend: str, dtype: str):
+    """每个工作进程各自加载一份语音识别模型，并限制 torch / CTranslate2 线程数以免多个进程争抢 CPU。"""
+    global _worker_model
+    import torch
+    from asr import create_backend
+    torch.set_num_threads(max(1, threads))
+    torch.set_num_interop_threads(1)
+    _worker_model = create_backend(backend, model_name, 'cpu', dtype=dtype, cpu_threads=max(1, threads))
+
+def _transcribe_chunk(audio: np.ndarray, language: str, decode_options: dict) -> dict:
+    return _worker_model.transcribe(audio, language=language, **decode_options)
+
+# --- 拼接 ---
+_NORMALIZE_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+def _normalize(text: str) -> str:
+    return _NORMALIZE_RE.sub("", text or "").lower()
+
+def append_chunk_segments(stitched: list, result: dict, offset: float, overlap_tolerance: float = 1.0) -> list:
+    """
+    把一块的转录结果平移到全局时间轴后追加到 stitched，返回新追加的片段。
+    若该块第一句与 stitched 最后一句文本相同且时间上重叠 (或相距不超过 overlap_tolerance 秒)，只保留前一个。
+    """
+    added = []
+    for i, seg in enumerate(result.get('segments') or []):
+        seg = dict(seg)
+        seg['start'] = seg.get('start', 0.0) + offset
+        seg['end'] = seg.get('end', 0.0) + offset
+        if seg.get('words'):
+            seg['words'] = [{**w, 'start': w.get('start', 0.0) + offset, 'end': w.get('end', 0.0) + offset}
+                            for w in seg['words']]
+        if not _normalize(seg.get('text')):
+            continue
+        if i == 0 and stitched:
+            prev = stitched[-1]
+            if (_normalize(prev.get('text')) == _normalize(seg.get('text'))
+                    and seg['start'] <= prev['end'] + overlap_tolerance):
+                prev['end'] = max(prev['end'], seg['end'])
+                continue
+        seg['id'] = len(stitched)
+        stitched.append(seg)
+        added.append(seg)
+    return added
+
+def stitch_segments(chunk_results: list, offsets: list, overlap_tolerance: float = 1.0) -> list:
+    """把各块的片段平移到全局时间轴并按顺序拼接，边界处的重复句只保留一次。"""
+    stitched = []
+    for result, offset in zip(chunk_results, offsets):
+        append_chunk_segments(stitched, result, offset, overlap_tolerance)
+    return stitched
+
+def transcribe_chunked(model, audio: np.ndarray, language: str = None, chunk_seconds: float = 60.0,
+                       on_segments=None, progress=None, **transcribe_options) -> dict:
+    """
+    在当前进程内按静音切块依次转录，每完成一块就通过 on_segments(新片段列表) 交出结果，
+    用于边转录边展示，并调用 progress(已完成块数, 总块数)。
+    上一块末尾的文本作为下一块的 initial_prompt，尽量保持上下文连贯。
+    """
+    audio = np.ascontiguousarray(audio, dtype=np.float32).reshape(-1)
+    stitched, prompt = [], None
+    chunks = plan_chunks(audio, WHISPER_SAMPLE_RATE, chunk_seconds)
+    for i, (start, end) in enumerate(chunks):
+        result = model.transcribe(audio[start:end], language=language, initial_prompt=prompt, **transcribe_options)
+        # 未指定语言时沿用第一块检测出的语言，保证整段一致
+        language = language or result.get('language')
+        added = append_chunk_segments(stitched, result, start / WHISPER_SAMPLE_RATE)
+        if added:
+            prompt = "".join(seg.get('text', '') for seg in stitched[-3:])[-200:]
+        if progress: progress(i + 1, len(chunks))
+        if on_segments and added:
+            on_segments(added)
+    return {'text': "".join(seg.get('text', '') for seg in stitched), 'segments': stitched, 'language': language}
+
+
+class ParallelWhisper:
+    """
+    在进程池中并行转录。音频在静音处切块，每个工作进程持有自己的模型并限制 torch 线程数，
+    结果按块顺序拼接并修正为全局时间戳。
+    未指定语言时先转录第一块，用检测出的语言转录其余各块，保证整段语言一致。
+    """
+    def __init__(self, model_name: str, workers: int, threads_per_worker: int = None, backend: str = 'openai-whisper',
+                 dtype: str = None):
+        self.model_name = model_name
+        self.backend = backend
+        self.dtype = dtype
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(1, available_cpus() // self.workers)
+        self._pool = None
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            print(f"启动 {self.workers} 个 {self.backend} 转录进程 (每个 {self.threads_per_worker} 线程)...")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.threads_per_worker, self.backend, self.dtype),
+            )
+        return self._pool
+
+    def transcribe(self, audio: np.ndarray, language: str = None, chunk_seconds: float = 120.0,
+                   progress=None, on_segments=None, **decode_options) -> dict:
+        audio = np.ascontiguousarray(audio, dtype=np.float32).reshape(-1)
+        chunks = plan_chunks(audio, WHISPER_SAMPLE_RATE, chunk_seconds)
+        # 已完成的块与已拼接的片段在重试之间保留，重试只重新提交未完成的块
+        results = [None] * len(chunks)
+        state = {'segments': [], 'stitched': 0}
+        for attempt in range(2):
+            try:
+                return self._transcribe_chunks(audio, chunks, results, state, language, progress, on_segments,
+                                               decode_options)
+            except BrokenProcessPool:
+                # 工作进程崩溃 (例如被 OOM 杀掉) 后进程池不可再用，丢弃它，下次使用时重新创建
+                self.shutdown()
+                if attempt:
+                    raise
+                print("转录进程异常退出，重建进程池后重试未完成的块...")
+
+    def _transcribe_chunks(self, audio, chunks, results, state, language, progress, on_segments, decode_options) -> dict:
+        offsets = [s / WHISPER_SAMPLE_RATE for s, _ in chunks]
+        pool = self._ensure_pool()
+        if language is None:
+            if results[0] is None:
+                results[0] = pool.submit(_transcribe_chunk, audio[chunks[0][0]:chunks[0][1]], None, decode_options).result()
+            language = results[0].get('language')
+        futures = [None if results[i] is not None else pool.submit(_transcribe_chunk, audio[s:e], language, decode_options)
+                   for i, (s, e) in enumerate(chunks)]
+        # 按块顺序收集结果，每拼接完一块就可以把新片段交给 on_segments
+        segments = state['segments']
+        try:
+            for i in range(state['stitched'], len(chunks)):
+                if results[i] is None:
+                    results[i] = futures[i].result()
+                added = append_chunk_segments(segments, results[i], offsets[i])
+                state['stitched'] = i + 1
+                if progress: progress(i + 1, len(chunks))
+                if on_segments and added: on_segments(added)
+        except BaseException:
+            # 进度回调抛出 (例如任务被取消) 时，撤回尚未开始的块，进程池可以留给下一个任务
+            for future in futures:
+                if future is not None: future.cancel()
+            raise
+        return {'text': "".join(seg.get('text', '') for seg in segments), 'segments': segments, 'language': language}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
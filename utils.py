@@ -1,94 +1,232 @@
 # utils.py
 
-import pysrt
+import re
+import numpy as np
 from dataclasses import dataclass, field
 from pathlib import Path
 
-# AppState 可以保持原样
+# AppState 保存在 app.storage.client 中，随浏览器标签页的连接存在，不做序列化
 @dataclass
 class AppState:
     video_path: Path = None
-    subtitles: list = field(default_factory=list)
-    selected_sub: 'Sub' = None
+    store: 'SubtitleStore' = field(default_factory=lambda: SubtitleStore())
+    job_id: str = None
 
-# 定义一个 Sub 类来更好地组织数据
-@dataclass
-class Sub:
-    id: int
-    start: pysrt.SubRipTime
-    end: pysrt.SubRipTime
-    speaker: str
-    text: str
-    pysrt_item: pysrt.SubRipItem # 保留对原始 pysrt 对象的引用，方便编辑和保存
-
-def load_srt_to_subs(srt_path: str) -> list[Sub]:
+# 说话人识别尚未完成时，实时展示的字幕使用的占位说话人
+PENDING_SPEAKER = '识别中'
+
+def format_ms(ms: int) -> str:
+    """毫秒转为 HH:MM:SS,mmm。"""
+    ms = max(0, int(ms))
+    h, rem = divmod(ms, 3600 * 1000)
+    m, rem = divmod(rem, 60 * 1000)
+    s, ms = divmod(rem, 1000)
+    return f"{h:02}:{m:02}:{s:02},{ms:03}"
+
+_TIMESTAMP_RE = re.compile(r"^\s*(?:(\d+):)?(\d{1,2}):(\d{1,2})(?:[,.](\d{1,3}))?\s*$")
+
+def parse_ms(text: str) -> int:
+    """解析 HH:MM:SS,mmm (或 MM:SS、小数点分隔的毫秒) 为毫秒。"""
+    match = _TIMESTAMP_RE.match(text or '')
+    if not match:
+        raise ValueError(f"无法识别的时间格式: {text}")
+    h, m, s, ms = match.groups()
+    return ((int(h or 0) * 60 + int(m)) * 60 + int(s)) * 1000 + int((ms or '0').ljust(3, '0'))
+
+
+class SubView:
     """
-    加载 SRT 文件并解析出说话人和文本。
-    格式假定为 "SPEAKER_ID: Text content"。
+    字幕存储中某一行的轻量视图，只记录所属存储与行号，读写都直接落在列数组上。
+    视图按需创建、用完即弃；行号在排序后会失效，需要长期引用时请使用 id。
     """
-    subs = []
-    try:
-        srt_file = pysrt.open(srt_path, encoding='utf-8')
-        for i, item in enumerate(srt_file):
-            full_text = item.text.strip()
-            speaker = '未知'
-            text_content = full_text
-            
-            # 尝试按冒号分割说话人和内容
-            if ': ' in full_text:
-                parts = full_text.split(': ', 1)
-                # 检查第一部分是否像一个说话人标签 (例如 SPEAKER_00, 不含空格)
-                if len(parts) == 2 and not ' ' in parts[0]:
-                    speaker = parts[0]
-                    text_content = parts[1]
-
-            subs.append(Sub(
-                id=i + 1,  # 使用新的连续 ID
-                start=item.start,
-                end=item.end,
-                speaker=speaker,
-                text=text_content,
-                pysrt_item=item
-            ))
-        # 重新编号 pysrt 对象，以防原始文件索引不连续
-        for i, sub in enumerate(subs):
-            sub.pysrt_item.index = i + 1
-
-    except Exception as e:
-        print(f"解析 SRT 文件时出错: {e}")
-    return subs
+    __slots__ = ('store', 'row')
 
-@dataclass
-class SpeakerBlock:
-    """代表一个说话人的连续对话块"""
-    speaker: str
-    subs: list[Sub] = field(default_factory=list)
+    def __init__(self, store: 'SubtitleStore', row: int):
+        self.store = store
+        self.row = row
+
+    @property
+    def id(self) -> int:
+        return int(self.store.ids[self.row])
+
+    @property
+    def start_ms(self) -> int:
+        return int(self.store.starts[self.row])
+
+    @property
+    def end_ms(self) -> int:
+        return int(self.store.ends[self.row])
+
+    @property
+    def speaker(self) -> str:
+        return self.store.speaker_names[self.store.speaker_codes[self.row]]
 
     @property
-    def start_time(self) -> pysrt.SubRipTime:
-        return self.subs[0].start if self.subs else pysrt.SubRipTime()
+    def text(self) -> str:
+        return self.store.texts[self.row]
 
     @property
-    def full_text(self) -> str:
-        return " ".join(sub.text for sub in self.subs)
-
-def group_subs_into_blocks(subs: list[Sub]) -> list[SpeakerBlock]:
-    """将扁平的字幕列表按说话人连续性分组"""
-    if not subs:
-        return []
-
-    blocks = []
-    current_block = SpeakerBlock(speaker=subs[0].speaker)
-    current_block.subs.append(subs[0])
-
-    for i in range(1, len(subs)):
-        sub = subs[i]
-        if sub.speaker == current_block.speaker:
-            current_block.subs.append(sub)
+    def words(self):
+        return self.store.words[self.row]
+
+
+class SubtitleStore:
+    """
+    列式字幕存储：起止时间 (毫秒) 为 NumPy 数组，说话人驻留为整数编码，文本为普通列表。
+    不为每行分配对象；按时间查找、按说话人筛选、排序与批量平移都是向量化操作。
+
+    每行有一个稳定的 id (从 1 开始，按追加顺序分配)，界面上用 id 引用字幕；
+    行号是当前排列中的位置，排序后会改变。
+    """
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.starts = np.empty(0, dtype=np.int64)
+        self.ends = np.empty(0, dtype=np.int64)
+        self.speaker_codes = np.empty(0, dtype=np.int32)
+        self.speaker_names = []   # 编码 -> 说话人
+        self._speaker_codes = {}  # 说话人 -> 编码
+        self.texts = []
+        self.words = []
+        self._row_of = np.empty(1, dtype=np.int64)  # id -> 行号
+        self._time_order = None   # 按开始时间排序的行号，修改后惰性重建
+        self._sorted_starts = None
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __iter__(self):
+        return (SubView(self, row) for row in range(len(self)))
+
+    def view(self, row: int) -> SubView:
+        return SubView(self, row)
+
+    def row_of(self, sub_id: int) -> int:
+        return int(self._row_of[sub_id])
+
+    def view_by_id(self, sub_id: int) -> SubView:
+        return SubView(self, self.row_of(sub_id))
+
+    def intern(self, speaker: str) -> int:
+        speaker = speaker or PENDING_SPEAKER
+        code = self._speaker_codes.get(speaker)
+        if code is None:
+            code = self._speaker_codes[speaker] = len(self.speaker_names)
+            self.speaker_names.append(speaker)
+        return code
+
+    @property
+    def speakers(self) -> list:
+        """当前仍在使用的说话人 (按编码顺序)。"""
+        used = np.unique(self.speaker_codes)
+        return [self.speaker_names[c] for c in used]
+
+    # --- 增删改 ---
+    def extend(self, segments: list) -> np.ndarray:
+        """批量追加流水线格式的片段 (起止为秒)，返回新行的 id。"""
+        n = len(segments)
+        first_id = len(self) + 1
+        new_ids = np.arange(first_id, first_id + n, dtype=np.int64)
+        self.ids = np.concatenate((self.ids, new_ids))
+        self.starts = np.concatenate((self.starts, np.fromiter(
+            (round((seg.get('start') or 0) * 1000) for seg in segments), dtype=np.int64, count=n)))
+        self.ends = np.concatenate((self.ends, np.fromiter(
+            (round((seg.get('end') or 0) * 1000) for seg in segments), dtype=np.int64, count=n)))
+        self.speaker_codes = np.concatenate((self.speaker_codes, np.fromiter(
+            (self.intern(seg.get('speaker')) for seg in segments), dtype=np.int32, count=n)))
+        self.texts.extend((seg.get('text') or '').strip() for seg in segments)
+        self.words.extend(seg.get('words') for seg in segments)
+        row_of = np.empty(first_id + n, dtype=np.int64)
+        row_of[:len(self._row_of)] = self._row_of
+        row_of[new_ids] = np.arange(first_id - 1, first_id - 1 + n)
+        self._row_of = row_of
+        self._time_order = None
+        return new_ids
+
+    def update(self, row: int, start_ms: int = None, end_ms: int = None, speaker: str = None,
+               text: str = None, words=None):
+        if start_ms is not None: self.starts[row] = start_ms
+        if end_ms is not None: self.ends[row] = end_ms
+        if speaker is not None: self.speaker_codes[row] = self.intern(speaker)
+        if text is not None: self.texts[row] = text
+        if words is not None: self.words[row] = words
+        if start_ms is not None: self._time_order = None
+
+    def truncate(self, n: int):
+        """只保留前 n 行 (流水线最终结果比实时结果少时使用)。要求未排序过，即行号与 id 一致。"""
+        self.ids, self.starts, self.ends = self.ids[:n], self.starts[:n], self.ends[:n]
+        self.speaker_codes = self.speaker_codes[:n]
+        del self.texts[n:], self.words[n:]
+        self._row_of = self._row_of[:n + 1]
+        self._time_order = None
+
+    def rename_speaker(self, old: str, new: str) -> np.ndarray:
+        """重命名说话人，返回受影响的行号。新名称未被使用时只改名表，不触碰任何行。"""
+        old_code = self._speaker_codes.get(old)
+        if old_code is None:
+            return np.empty(0, dtype=np.int64)
+        rows = self.rows_for_speaker(old)
+        new_code = self._speaker_codes.get(new)
+        if new_code is None:
+            self.speaker_names[old_code] = new
+            del self._speaker_codes[old]
+            self._speaker_codes[new] = old_code
         else:
-            blocks.append(current_block)
-            current_block = SpeakerBlock(speaker=sub.speaker)
-            current_block.subs.append(sub)
-    
-    blocks.append(current_block) # 不要忘记最后一个块
-    return blocks
\ No newline at end of file
+            self.speaker_codes[rows] = new_code
+        return rows
+
+    # --- 查询 ---
+    def rows_for_speaker(self, speaker: str) -> np.ndarray:
+        code = self._speaker_codes.get(speaker)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.speaker_codes == code)
+
+    def time_order(self) -> np.ndarray:
+        if self._time_order is None:
+            self._time_order = np.argsort(self.starts, kind='stable')
+            self._sorted_starts = self.starts[self._time_order]
+        return self._time_order
+
+    def row_at(self, ms: int) -> int:
+        """O(log n) 找出在 ms 时刻正在显示的字幕行号；没有则返回 -1。排序索引在修改后首次查询时重建。"""
+        order = self.time_order()
+        k = int(np.searchsorted(self._sorted_starts, ms, side='right')) - 1
+        if k < 0:
+            return -1
+        row = int(order[k])
+        return row if self.ends[row] > ms else -1
+
+    def speaker_runs(self) -> list:
+        """按当前行顺序把连续相同说话人的行分组，返回 (说话人, 起始行, 结束行) 列表 (左闭右开)。"""
+        n = len(self)
+        if n == 0:
+            return []
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(self.speaker_codes)) + 1, [n]))
+        return [(self.speaker_names[self.speaker_codes[s]], int(s), int(e)) for s, e in zip(bounds[:-1], bounds[1:])]
+
+    # --- 批量操作 ---
+    def sort_by_start(self):
+        """按开始时间稳定排序所有列。"""
+        order = self.time_order()
+        self.ids, self.starts, self.ends = self.ids[order], self.starts[order], self.ends[order]
+        self.speaker_codes = self.speaker_codes[order]
+        self.texts = [self.texts[i] for i in order]
+        self.words = [self.words[i] for i in order]
+        self._row_of[self.ids] = np.arange(len(self))
+        self._time_order = None
+
+    def retime(self, offset_ms: int = 0, scale: float = 1.0, rows=None):
+        """批量平移/缩放时间轴: t' = t * scale + offset_ms。rows 为空时作用于全部字幕。"""
+        rows = slice(None) if rows is None else rows
+        self.starts[rows] = np.maximum(0, np.round(self.starts[rows] * scale) + offset_ms).astype(np.int64)
+        self.ends[rows] = np.maximum(0, np.round(self.ends[rows] * scale) + offset_ms).astype(np.int64)
+        self._time_order = None
+
+    def to_segments(self) -> list:
+        """按开始时间排序，转回流水线的片段格式，供 export 模块导出。"""
+        starts, ends, codes = self.starts.tolist(), self.ends.tolist(), self.speaker_codes.tolist()
+        return [
+            {'start': starts[row] / 1000, 'end': ends[row] / 1000, 'speaker': self.speaker_names[codes[row]],
+             'text': self.texts[row], 'words': self.words[row]}
+            for row in self.time_order().tolist()
+        ]
@@ -1,19 +1,22 @@
 # webui.py
 
-import tempfile
+import json
 from pathlib import Path
-import pysrt
+from dataclasses import dataclass
 import asyncio
 import traceback
 from typing import List, Dict
 from functools import partial  # <<< 核心改动 1: 导入 partial
 
+import numpy as np
 from nicegui import app, ui, context, Client
 from nicegui.events import UploadEventArguments
 
 # 确保从你的 utils 和 config 模块正确导入
-from utils import load_srt_to_subs, AppState, group_subs_into_blocks, Sub
-from config import save_config, get_config
+from utils import AppState, SubtitleStore, SubView, format_ms, parse_ms
+from export import EXPORTERS
+from config import save_config, get_config, PIPELINE_PROFILES, DEFAULT_PROFILE
+from jobs import QUEUED, CANCELLING, DONE, FAILED, CANCELLED, FINISHED_STATES
 
 CACHE_DIR = Path('./cache')
 if not CACHE_DIR.exists():
@@ -23,20 +26,257 @@ DEMO_VIDEO_PATH = CACHE_DIR / 'demo.mp4'
     
 SPEAKER_COLORS = ['red', 'orange', 'amber', 'lime', 'green', 'teal', 'cyan', 'indigo', 'purple']
 
-def main_page(subtitle_generator, app_config):
+# 对话视图的虚拟滚动：只实例化视口附近的说话人块，其余用上下两个占位元素撑开高度
+BLOCK_BASE_HEIGHT = 56  # 说话人标签与块间距 (px)
+ROW_HEIGHT = 40  # 单行字幕的高度 (px)
+LINE_HEIGHT = 20  # 字幕折行后每多一行增加的高度 (px)
+CHARS_PER_LINE = 40
+OVERSCAN_PX = 800  # 视口上下额外渲染的范围 (px)
+HIGHLIGHT_CLASS = 'bg-slate-600'  # 播放位置所在字幕的高亮样式
+
+def _table_row(sub: SubView) -> dict:
+    return {'id': sub.id, 'speaker': sub.speaker, 'start': format_ms(sub.start_ms), 'end': format_ms(sub.end_ms), 'text': sub.text}
+
+def _short_time(sub: SubView) -> str:
+    minutes, seconds = divmod(sub.start_ms // 1000, 60)
+    return f"{minutes:02}:{seconds:02}"
+
+def _block_offsets(store: SubtitleStore, runs: list) -> np.ndarray:
+    """按文本长度估算每个块的高度，返回各块顶部位置的前缀和 (比块数多一项)。"""
+    if not runs:
+        return np.zeros(1, dtype=np.int64)
+    lengths = np.fromiter(map(len, store.texts), dtype=np.int64, count=len(store))
+    row_heights = ROW_HEIGHT + LINE_HEIGHT * (lengths // CHARS_PER_LINE)
+    heights = BLOCK_BASE_HEIGHT + np.add.reduceat(row_heights, [start for _, start, _ in runs])
+    return np.concatenate(([0], np.cumsum(heights)))
+
+@dataclass
+class _BlockView:
+    """对话视图中一个说话人块对应的元素。key 为 (首条 ID, 末条 ID, 条数)，ids 为块内字幕 ID。"""
+    key: tuple
+    ids: list
+    speaker: str
+    column: ui.column
+    chip: ui.chip
+
+
+class EditorViews:
+    """
+    表格视图与对话视图的增量渲染。记住每个已渲染说话人块对应的元素，
+    编辑后只修补发生变化的行、标签和说话人块，编辑延迟与字幕总数无关。
+
+    对话视图是虚拟滚动的：说话人块只是字幕存储上的 (说话人, 起始行, 结束行) 区间，
+    高度向量化估算，只有视口附近的块会创建元素，滚动时按需增删。
+    表格行按 ID 顺序排列，第 i 行即 ID 为 i + 1 的字幕。
+    """
+    def __init__(self, table: ui.table, scroll_area: ui.scroll_area, dialogue_container: ui.column, on_edit, on_rename, on_seek):
+        self.table = table
+        self.scroll_area = scroll_area
+        self.container = dialogue_container
+        self.on_edit = on_edit
+        self.on_rename = on_rename
+        self.on_seek = on_seek
+        self.store = SubtitleStore()
+        self.sub_labels = {}  # sub.id -> (行元素, 时间标签, 文本标签)，仅包含已渲染的字幕
+        self.blocks = []      # 全部说话人块 (说话人, 起始行, 结束行)
+        self.block_starts = np.zeros(0, dtype=np.int64)  # 各块的起始行，用于由行号反查所在块
+        self.keys = []        # 与 blocks 对应的 key
+        self.highlighted = None  # 当前播放位置所在字幕的 ID
+        self.offsets = np.zeros(1, dtype=np.int64)  # 各块顶部的估计像素位置 (前缀和)，比 blocks 多一项
+        self.rendered = {}    # key -> _BlockView，仅视口附近的块
+        self.window = (0, 0)  # 已渲染块的下标范围 [first, last)
+        self.viewport = (0, 800)  # (滚动位置, 视口高度)
+        self.colors = {}      # 说话人 -> 颜色；一经分配不再变化，增量更新时颜色保持稳定
+        self._reset_container()
+        # 滚动事件在浏览器端节流，长字幕滚动时不会刷屏 websocket
+        scroll_area.on('scroll', self._on_scroll, ['verticalPosition', 'verticalContainerSize'], throttle=0.1)
+
+    def _color(self, speaker: str) -> str:
+        if speaker not in self.colors:
+            self.colors[speaker] = SPEAKER_COLORS[len(self.colors) % len(SPEAKER_COLORS)]
+        return self.colors[speaker]
+
+    def _reset_container(self):
+        self.container.clear()
+        with self.container:
+            self.top_spacer = ui.element('div').style('height: 0px')
+            self.bottom_spacer = ui.element('div').style('height: 0px')
+        self.rendered, self.sub_labels, self.window = {}, {}, (0, 0)
+
+    def clear(self):
+        self.blocks, self.keys, self.offsets = [], [], np.zeros(1, dtype=np.int64)
+        self.block_starts, self.highlighted = np.zeros(0, dtype=np.int64), None
+        self.store = SubtitleStore()
+        self._reset_container()
+        self.table.rows.clear()
+        self.table.update()
+
+    def render_all(self, store: SubtitleStore):
+        """加载新字幕时渲染一次，之后的编辑都走 apply_changes。"""
+        self.clear()
+        self.store = store
+        self.table.rows[:] = [_table_row(s) for s in store]
+        self.table.update()
+        if not len(store):
+            with self.container:
+                ui.label("未能加载对话内容。").classes('text-center text-gray-500 p-4')
+            return
+        self._set_blocks()
+        self.viewport = (0, self.viewport[1])
+        self.scroll_area.scroll_to(pixels=0)
+        self._sync()
+
+    def _set_blocks(self):
+        ids = self.store.ids.tolist()
+        self.blocks = self.store.speaker_runs()
+        self.block_starts = np.array([start for _, start, _ in self.blocks], dtype=np.int64)
+        self.keys = [(ids[start], ids[end - 1], end - start) for _, start, end in self.blocks]
+        self.offsets = _block_offsets(self.store, self.blocks)
+
+    def _visible_range(self, margin: int) -> tuple:
+        top, height = self.viewport
+        first = max(0, int(np.searchsorted(self.offsets, top - margin, side='right')) - 1)
+        last = min(len(self.blocks), int(np.searchsorted(self.offsets, top + height + margin, side='left')))
+        return first, max(first, last)
+
+    def _on_scroll(self, e):
+        self.viewport = (e.args.get('verticalPosition') or 0, e.args.get('verticalContainerSize') or self.viewport[1])
+        # 真正可见的范围仍在已渲染窗口内时不做任何事，避免每次滚动都增删元素
+        first, last = self._visible_range(0)
+        if first < self.window[0] or last > self.window[1]:
+            self._sync()
+
+    def _build_block(self, i: int) -> _BlockView:
+        speaker, start, end = self.blocks[i]
+        with ui.column().classes('w-full gap-2 mb-4') as column:
+            chip = ui.chip(speaker, icon='person', color=self._color(speaker)).classes('font-bold cursor-pointer')
+            view = _BlockView(key=self.keys[i], ids=self.store.ids[start:end].tolist(), speaker=speaker, column=column, chip=chip)
+            # 点击时读取块的当前说话人，重命名后无需重新绑定事件
+            chip.on('click', lambda v=view: self.on_rename(v.speaker))
+            for row in range(start, end):
+                sub = self.store.view(row)
+                # 事件绑定字幕 ID 而不是行号，存储重排后仍指向同一条字幕
+                with ui.row().classes('w-full items-start cursor-pointer hover:bg-slate-700 rounded-md p-2 transition-colors') \
+                    .on('click', partial(self.on_edit, sub.id)) as row_element:
+                    # 点击时间跳转播放位置；.stop 阻止事件冒泡到行上打开编辑框
+                    time_label = ui.label(_short_time(sub)).classes('w-16 text-xs text-gray-400 pt-1 hover:underline') \
+                        .on('click.stop', partial(self.on_seek, sub.id))
+                    text_label = ui.label(sub.text).classes('flex-grow text-sm')
+                if sub.id == self.highlighted:
+                    row_element.classes(add=HIGHLIGHT_CLASS)
+                self.sub_labels[sub.id] = (row_element, time_label, text_label)
+        return view
+
+    def _drop_view(self, view: _BlockView):
+        view.column.delete()
+        for sub_id in view.ids:
+            self.sub_labels.pop(sub_id, None)
+
+    def _sync(self):
+        """让已渲染的块与目标窗口一致：删除窗口外的块，补建窗口内缺失的块，并调整占位高度。"""
+        first, last = self._visible_range(OVERSCAN_PX)
+        wanted = set(self.keys[first:last])
+        for key in [k for k in self.rendered if k not in wanted]:
+            self._drop_view(self.rendered.pop(key))
+        for i in range(first, last):
+            key = self.keys[i]
+            if key not in self.rendered:
+                with self.container:
+                    view = self._build_block(i)
+                view.column.move(target_index=1 + i - first)  # 第 0 个子元素是顶部占位
+                self.rendered[key] = view
+        self.window = (first, last)
+        self.top_spacer.style(f'height: {int(self.offsets[first])}px')
+        self.bottom_spacer.style(f'height: {int(self.offsets[-1] - self.offsets[last])}px')
+
+    def _patch_rows(self, changed_ids: list):
+        # 服务端的行数据原地修改 (不触发整表下发)，客户端通过一段 JS 只替换对应的行
+        patches = []
+        for sub_id in changed_ids:
+            row = _table_row(self.store.view_by_id(sub_id))
+            i = sub_id - 1
+            if i >= len(self.table.rows):
+                # 新出现的字幕 (实时转录) 追加到末尾；splice 在末尾处等同于 push
+                i = len(self.table.rows)
+                self.table.rows.append(row)
+            else:
+                self.table.rows[i] = row
+            patches.append(f"rows.splice({i}, 1, {json.dumps(row, ensure_ascii=False)});")
+        if patches:
+            self.table.client.run_javascript(
+                f"(() => {{ const el = mounted_app.elements[{self.table.id}]; if (!el) return; "
+                f"const rows = el.props.rows; {' '.join(patches)} }})()")
+
+    def apply_changes(self, store: SubtitleStore, changed_ids: list):
+        """
+        store 为当前的字幕存储，changed_ids 为被修改过或新增的字幕 ID (按 ID 升序)。
+        分组只在数据层重算；组成不变的已渲染块原地修补，组成变化的块才重建。
+        """
+        if not len(changed_ids): return
+        self.store = store
+        changed_ids = [int(i) for i in changed_ids]
+        self._patch_rows(changed_ids)
+        self._set_blocks()
+        block_by_key = dict(zip(self.keys, self.blocks))
+        for key in list(self.rendered):
+            block = block_by_key.get(key)
+            if block is None:
+                self._drop_view(self.rendered.pop(key))
+                continue
+            view = self.rendered[key]
+            if view.speaker != block[0]:
+                view.speaker = block[0]
+                view.chip.text = block[0]
+                view.chip.props(f'color={self._color(block[0])}')
+        for sub_id in changed_ids:
+            labels = self.sub_labels.get(sub_id)
+            if labels:
+                sub = store.view_by_id(sub_id)
+                labels[1].text = _short_time(sub)
+                labels[2].text = sub.text
+        self._sync()
+
+    def highlight_at(self, ms: int):
+        """
+        高亮 ms 时刻正在显示的字幕。查找是存储上的一次二分，与字幕总数无关；
+        所在块不在视口内时滚动过去，用户正在阅读的可见区域不会被打断。
+        """
+        row = self.store.row_at(ms)
+        sub_id = int(self.store.ids[row]) if row >= 0 else None
+        if sub_id == self.highlighted:
+            return
+        if self.highlighted in self.sub_labels:
+            self.sub_labels[self.highlighted][0].classes(remove=HIGHLIGHT_CLASS)
+        self.highlighted = sub_id
+        if sub_id is None:
+            return
+        if sub_id in self.sub_labels:
+            self.sub_labels[sub_id][0].classes(add=HIGHLIGHT_CLASS)
+        i = int(np.searchsorted(self.block_starts, row, side='right')) - 1
+        first, last = self._visible_range(0)
+        if 0 <= i < len(self.blocks) and not first <= i < last:
+            # 滚动事件回传后 _sync 会渲染目标块，并在创建时带上高亮样式
+            self.scroll_area.scroll_to(pixels=int(self.offsets[i]))
+
+def main_page(job_queue, app_config):
     ui.dark_mode().enable()
 
-    if not subtitle_generator:
+    if not job_queue:
         with ui.column().classes('w-full h-screen flex items-center justify-center'):
             ui.label('后端服务启动失败!').classes('text-2xl text-negative')
             ui.label('请先前往“设置”页面完成必要配置。').classes('text-lg')
             ui.button('前往设置', on_click=lambda: ui.navigate.to('/settings')).classes('mt-4')
         return
 
-    app.storage.user['state'] = AppState()
-    state: AppState = app.storage.user['state']
+    # 字幕存储含 NumPy 数组，放在随连接存在的 client 存储中，不做 JSON 序列化
+    app.storage.client['state'] = AppState()
+    state: AppState = app.storage.client['state']
     
     ui_elements: Dict[str, ui.element] = {}
+    # 用户手动改过的字幕 ID；实时转录推送的更新不会覆盖这些字幕
+    edited_ids = set()
+    # 转录过程中的说话人重命名 (原名 -> 新名)，应用到之后推送的片段上，文本与时间照常更新
+    speaker_renames: Dict[str, str] = {}
 
     async def rename_speaker_dialog(old_name: str):
         with ui.dialog() as dialog, ui.card():
@@ -48,45 +288,41 @@ def main_page(subtitle_generator, app_config):
                 if not new_name or new_name == old_name:
                     ui.notify("新名称不能为空或与旧名称相同。", type='warning')
                     return
-                modified_count = 0
-                for sub in state.subtitles:
-                    if sub.speaker == old_name:
-                        sub.speaker = new_name
-                        sub.pysrt_item.text = f"{new_name}: {sub.text}"
-                        modified_count += 1
-                ui.notify(f"成功将 '{old_name}' 的 {modified_count} 条字幕重命名为 '{new_name}'。", type='positive')
-                dialog.submit('renamed')
+                rows = state.store.rename_speaker(old_name, new_name)
+                ui.notify(f"成功将 '{old_name}' 的 {len(rows)} 条字幕重命名为 '{new_name}'。", type='positive')
+                dialog.submit(np.sort(state.store.ids[rows]).tolist())
 
             with ui.row().classes('w-full justify-end mt-4'):
                 ui.button('取消', on_click=dialog.close)
                 ui.button('保存', on_click=apply_rename, color='primary')
 
         result = await dialog
-        if result == 'renamed':
-            await redraw_views()
+        if result:
+            for original, current in speaker_renames.items():
+                if current == old_name: speaker_renames[original] = new_name
+            speaker_renames.setdefault(old_name, new_name)
+            views.apply_changes(state.store, result)
 
-    async def edit_sub_dialog(sub: Sub):
+    async def edit_sub_dialog(sub_id: int):
+        sub = state.store.view_by_id(sub_id)
         with ui.dialog() as dialog, ui.card().style('min-width: 600px'):
             ui.label('编辑字幕').classes('text-xl font-bold mb-4')
-            unique_speakers = sorted(list(set(s.speaker for s in state.subtitles if s.speaker != '未知')))
+            unique_speakers = sorted(s for s in state.store.speakers if s != '未知')
             initial_speaker_value = sub.speaker if sub.speaker in unique_speakers else None
             new_speaker_input = ui.input("新说话人 (可选)").props('outlined dense')
             with ui.row().classes('w-full'):
                 speaker_select = ui.select(unique_speakers, label='分配给已有说话人', value=initial_speaker_value, clearable=True).classes('flex-grow')
-            start_input = ui.input('开始时间', value=str(sub.start))
-            end_input = ui.input('结束时间', value=str(sub.end))
+            start_input = ui.input('开始时间', value=format_ms(sub.start_ms))
+            end_input = ui.input('结束时间', value=format_ms(sub.end_ms))
             text_area = ui.textarea('内容', value=sub.text).props('autogrow outlined')
             with ui.row().classes('w-full justify-end mt-4'):
                 def apply_and_close():
                     try:
                         final_speaker = new_speaker_input.value.strip() or speaker_select.value or "未知"
-                        sub.speaker = final_speaker
-                        sub.start.from_string(start_input.value)
-                        sub.end.from_string(end_input.value)
-                        sub.text = text_area.value.strip()
-                        sub.pysrt_item.start = sub.start
-                        sub.pysrt_item.end = sub.end
-                        sub.pysrt_item.text = f"{sub.speaker}: {sub.text}"
+                        # 先解析全部输入，格式错误时不留下改了一半的字幕
+                        start_ms, end_ms = parse_ms(start_input.value), parse_ms(end_input.value)
+                        state.store.update(state.store.row_of(sub_id), start_ms=start_ms, end_ms=end_ms,
+                                           speaker=final_speaker, text=text_area.value.strip())
                         dialog.submit('ok')
                     except Exception as e:
                         ui.notify(f"格式错误或无效输入: {e}", type='negative')
@@ -95,42 +331,22 @@ def main_page(subtitle_generator, app_config):
         
         result = await dialog
         if result == 'ok':
-            await redraw_views()
+            edited_ids.add(sub_id)
+            views.apply_changes(state.store, [sub_id])
 
-    async def redraw_views():
-        if not state.subtitles: return
+    def show_video():
+        video_container = ui_elements['video_container']
+        video_container.clear()
+        with video_container:
+            video = ui_elements['video'] = ui.video(f'/video/{state.video_path.name}').classes('w-full h-full')
+        # timeupdate 在浏览器端节流后才回传，播放时不会刷屏 websocket
+        video.on('timeupdate', lambda e: views.highlight_at(round((e.args.get('currentTime') or 0) * 1000)),
+                 ['currentTime'], throttle=0.25)
 
-        table = ui_elements.get('table')
-        if table:
-            table.rows = [{'id': s.id, 'speaker': s.speaker, 'start': str(s.start), 'end': str(s.end), 'text': s.text} for s in state.subtitles]
-            table.update()
-        
-        dialogue_container = ui_elements.get('dialogue_container')
-        if dialogue_container:
-            all_speaker_blocks = group_subs_into_blocks(state.subtitles)
-            dialogue_container.clear()
-            with dialogue_container:
-                if not all_speaker_blocks:
-                    ui.label("未能加载对话内容。").classes('text-center text-gray-500 p-4')
-                    return
-                speaker_color_map = {}
-                color_index = 0
-                for block in all_speaker_blocks:
-                    if block.speaker not in speaker_color_map:
-                        speaker_color_map[block.speaker] = SPEAKER_COLORS[color_index % len(SPEAKER_COLORS)]
-                        color_index += 1
-                    color = speaker_color_map[block.speaker]
-                    with ui.column().classes('w-full gap-2 mb-4'):
-                        # <<< 核心改动 2: 使用 functools.partial 绑定点击事件 >>>
-                        ui.chip(block.speaker, icon='person', color=color).classes('font-bold cursor-pointer') \
-                            .on('click', partial(rename_speaker_dialog, block.speaker))
-                        
-                        for sub in block.subs:
-                            # <<< 核心改动 3: 对这里也使用 partial 以保持一致和稳定 >>>
-                            with ui.row().classes('w-full items-start cursor-pointer hover:bg-slate-700 rounded-md p-2 transition-colors') \
-                                .on('click', partial(edit_sub_dialog, sub)):
-                                ui.label(f"{sub.start.minutes:02}:{sub.start.seconds:02}").classes('w-16 text-xs text-gray-400 pt-1')
-                                ui.label(sub.text).classes('flex-grow text-sm')
+    def seek_to_sub(sub_id: int):
+        video = ui_elements.get('video')
+        if video is not None:
+            video.seek(state.store.view_by_id(sub_id).start_ms / 1000)
 
     async def load_demo_video():
         if not DEMO_VIDEO_PATH.exists():
@@ -139,14 +355,10 @@ def main_page(subtitle_generator, app_config):
         
         generate_button.props('disable')
         save_button.props('disable')
-        if ui_elements.get('dialogue_container'): ui_elements['dialogue_container'].clear()
-        if ui_elements.get('table'): ui_elements['table'].rows.clear(); ui_elements['table'].update()
+        views.clear()
 
         state.video_path = DEMO_VIDEO_PATH
-        video_container = ui_elements['video_container']
-        video_container.clear()
-        with video_container:
-            ui.video(f'/video/{state.video_path.name}').classes('w-full h-full')
+        show_video()
         
         ui.notify('演示视频加载成功！', type='positive')
         generate_button.props(remove='disable')
@@ -155,8 +367,7 @@ def main_page(subtitle_generator, app_config):
         with client:
             generate_button.props('disable')
             save_button.props('disable')
-            if ui_elements.get('dialogue_container'): ui_elements['dialogue_container'].clear()
-            if ui_elements.get('table'): ui_elements['table'].rows.clear(); ui_elements['table'].update()
+            views.clear()
             
             video_path = CACHE_DIR / e.name
             upload_notification = ui.notification(f"正在上传 {e.name}...", spinner=True, timeout=None, position='bottom-right')
@@ -170,10 +381,7 @@ def main_page(subtitle_generator, app_config):
                         await asyncio.to_thread(f.write, chunk)
                 
                 state.video_path = video_path
-                video_container = ui_elements['video_container']
-                video_container.clear()
-                with video_container:
-                    ui.video(f'/video/{state.video_path.name}').classes('w-full h-full')
+                show_video()
                     
                 upload_notification.dismiss()
                 ui.notify(f"视频 '{e.name}' 上传成功！", type='positive')
@@ -192,51 +400,103 @@ def main_page(subtitle_generator, app_config):
         generate_button.props('disable'); upload_button.props('disable')
         progress_notification = ui.notification('准备开始...', position='bottom-right', timeout=None, multi_line=True, spinner=True)
         
-        try:
-            def update_progress(msg: str):
-                if progress_notification: progress_notification.message = msg
+        state.store = SubtitleStore()
+        edited_ids.clear()
+        speaker_renames.clear()
+        views.clear()
+        segments_seq = 0
 
-            loop = asyncio.get_running_loop()
-            srt_path_str = await loop.run_in_executor(
-                None, subtitle_generator.run, 
+        async def pull_segments():
+            """拉取工作进程新写入的片段并增量合并到编辑器中。"""
+            nonlocal segments_seq
+            rows, segments_seq, total = await asyncio.to_thread(job_queue.get_segments, state.job_id, segments_seq)
+            store = state.store
+            changed, appended = [], []
+            for row in rows:
+                speaker = speaker_renames.get(row['speaker'], row['speaker'])
+                # 片段序号即行号 (网页端不重排存储)，字幕 ID 为序号 + 1
+                if row['idx'] < len(store):
+                    if row['idx'] + 1 in edited_ids: continue
+                    store.update(row['idx'], start_ms=round(row['start_time'] * 1000), end_ms=round(row['end_time'] * 1000),
+                                 speaker=speaker, text=(row['text'] or '').strip(), words=row['words'])
+                    changed.append(row['idx'] + 1)
+                else:
+                    appended.append({'start': row['start_time'], 'end': row['end_time'], 'speaker': speaker,
+                                     'text': row['text'], 'words': row['words']})
+            if appended:
+                changed.extend(store.extend(appended).tolist())
+            if total < len(store):
+                store.truncate(total)
+                views.render_all(store)
+            elif changed:
+                views.apply_changes(store, changed)
+
+        try:
+            job_id = await asyncio.to_thread(
+                job_queue.submit,
                 str(state.video_path),
                 language_select.value if language_select.value != 'auto' else None,
                 int(num_speakers_input.value),
-                update_progress
             )
+            state.job_id = job_id
+            cancel_button.props(remove='disable')
 
-            if srt_path_str and Path(srt_path_str).exists():
-                ui.notify('SRT文件已生成，正在解析...', type='info')
-                state.subtitles = load_srt_to_subs(srt_path_str)
-                if not state.subtitles:
-                    ui.notify('警告: SRT文件解析成功，但内容为空！', type='warning')
-                
-                await redraw_views()
+            # 任务在独立的工作进程中执行，这里轮询任务表获取排队位置与各阶段进度
+            while True:
+                job = await asyncio.to_thread(job_queue.get, job_id)
+                if job is None or job['status'] in FINISHED_STATES:
+                    break
+                if job['status'] == QUEUED:
+                    position = await asyncio.to_thread(job_queue.queue_position, job_id)
+                    progress_notification.message = f"排队中，前方还有 {max(position - 1, 0)} 个任务..."
+                elif job['status'] == CANCELLING:
+                    progress_notification.message = "正在取消..."
+                else:
+                    progress_notification.message = job['message'] or '处理中...'
+                    await pull_segments()
+                await asyncio.sleep(1.0)
+
+            if job and job['status'] == CANCELLED:
+                progress_notification.dismiss()
+                ui.notify('任务已取消。', type='info')
+            elif job and job['status'] == FAILED:
+                progress_notification.dismiss()
+                ui.notify(f"字幕生成失败: {job['error']}", type='negative', multi_line=True)
+            elif job and job['status'] == DONE:
+                # 最终结果作为最后一批片段写入任务表，直接构造字幕，不再经过 SRT 文件
+                await pull_segments()
+                if not len(state.store):
+                    ui.notify('警告: 字幕生成成功，但内容为空！', type='warning')
                 save_button.props(remove='disable')
                 progress_notification.dismiss()
-                ui.notify('字幕处理完毕!', type='positive')
+                run_info = job.get('run_info')
+                detail = ''
+                if run_info:
+                    separation = '跳过' if run_info['separation'] == 'skipped' else 'Demucs'
+                    detail = f" (档位 {run_info['profile']}，模型 {run_info['model']}，人声分离: {separation})"
+                ui.notify(f'字幕处理完毕!{detail}', type='positive')
             else:
                 progress_notification.dismiss()
-                ui.notify(f'字幕生成失败: 未找到SRT文件。', type='negative', multi_line=True)
+                ui.notify('字幕生成失败: 任务记录不存在。', type='negative', multi_line=True)
         except Exception as ex:
             traceback.print_exc()
             progress_notification.dismiss()
             ui.notify(f"处理时发生意外错误: {ex}", type='negative', multi_line=True)
         finally:
+            state.job_id = None
+            cancel_button.props('disable')
             generate_button.props(remove='disable'); upload_button.props(remove='disable')
 
-    def download_srt():
-        if not state.subtitles:
+    async def cancel_job():
+        if state.job_id:
+            await asyncio.to_thread(job_queue.cancel, state.job_id)
+            cancel_button.props('disable')
+
+    def download_subtitles(fmt: str):
+        if not len(state.store):
             ui.notify("没有字幕可以保存。", type='warning'); return
-        for sub in state.subtitles:
-            sub.pysrt_item.text = f"{sub.speaker}: {sub.text}"
-            sub.pysrt_item.start = sub.start
-            sub.pysrt_item.end = sub.end
-        final_srt = pysrt.SubRipFile([sub.pysrt_item for sub in sorted(state.subtitles, key=lambda s: s.start)])
-        final_srt.clean_indexes()
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.srt', delete=False, encoding='utf-8') as f:
-            f.write(str(final_srt)); temp_srt_path = f.name
-        ui.download(temp_srt_path, filename=f'{state.video_path.stem}_edited.srt')
+        content = EXPORTERS[fmt](state.store.to_segments())
+        ui.download(content.encode('utf-8'), filename=f'{state.video_path.stem}_edited.{fmt}')
 
     # --- UI 布局 ---
     with ui.header(elevated=True).classes('bg-slate-800 justify-between px-4'):
@@ -255,7 +515,10 @@ def main_page(subtitle_generator, app_config):
             upload_button = ui.button('加载视频', on_click=lambda: video_uploader.run_method('pickFiles'), icon='movie', color='primary')
             ui.button('加载演示', on_click=load_demo_video, icon='play_circle_outline').tooltip('加载服务器 cache/demo.mp4 文件')
             generate_button = ui.button('生成字幕', on_click=generate_subtitles, icon='auto_fix_high').props('disable')
-            save_button = ui.button('保存 SRT', on_click=download_srt, icon='save').props('disable')
+            cancel_button = ui.button('取消任务', on_click=cancel_job, icon='cancel', color='negative').props('disable')
+            with ui.dropdown_button('导出字幕', icon='save', auto_close=True).props('disable') as save_button:
+                for fmt in EXPORTERS:
+                    ui.item(fmt.upper(), on_click=partial(download_subtitles, fmt))
             ui.link('设置', '/settings').classes('text-white')
 
     with ui.splitter(value=50).classes('w-full h-screen-minus-header bg-slate-900') as splitter:
@@ -273,8 +536,8 @@ def main_page(subtitle_generator, app_config):
                 
                 with ui.tab_panels(tabs, value=dialogue_tab).classes('w-full flex-grow bg-slate-800'):
                     with ui.tab_panel(dialogue_tab).classes('p-0'):
-                        with ui.column().classes('w-full h-full overflow-y-auto p-4'):
-                            ui_elements['dialogue_container'] = ui.column().classes('w-full gap-2')
+                        with ui.scroll_area().classes('w-full h-full') as dialogue_scroll:
+                            ui_elements['dialogue_container'] = ui.column().classes('w-full gap-2 p-4')
                     
                     with ui.tab_panel(table_tab).classes('p-0'):
                         ui_elements['table'] = ui.table(
@@ -286,19 +549,26 @@ def main_page(subtitle_generator, app_config):
                                 {'name': 'text', 'label': '内容', 'field': 'text', 'align': 'left'}
                             ],
                             rows=[], row_key='id', selection='single',
-                            on_select=lambda e: asyncio.create_task(edit_sub_dialog(next(s for s in state.subtitles if s.id == e.selection[0]['id']))) if e.selection else None
+                            on_select=lambda e: asyncio.create_task(edit_sub_dialog(e.selection[0]['id'])) if e.selection else None
                         ).classes('w-full h-full').props('dark')
 
+    views = EditorViews(ui_elements['table'], dialogue_scroll, ui_elements['dialogue_container'],
+                        on_edit=edit_sub_dialog, on_rename=rename_speaker_dialog, on_seek=seek_to_sub)
+
+# 修改后必须重启进程才能生效的配置项 (其余配置由工作进程在下一个任务开始时热加载)
+RESTART_REQUIRED_KEYS = ('hf_cache_dir', 'num_workers', 'cpu_threads_per_job', 'cpu_interop_threads', 'cpu_affinity')
+
 @ui.page('/settings')
-def settings_page(restart_func):
+def settings_page(restart_func, hot_reload: bool = False):
     ui.dark_mode().enable()
     with ui.column().classes('w-full max-w-2xl mx-auto p-8 gap-6'):
         with ui.row().classes('w-full items-center justify-between'):
             ui.label('应用设置').classes('text-3xl font-bold')
             ui.button('返回主页', on_click=lambda: ui.navigate.to('/'), icon='home')
         ui.markdown("""
-            修改配置后，请**保存**并**重启应用**以使所有更改生效。
+            修改 Whisper 模型或 Token 后**保存**即可，新任务会自动使用新配置；修改缓存目录后需要**重启应用**。
             - **Whisper 模型**: 推荐 `large-v3` 以获得最佳效果。
+            - **处理档位**: `fast` 使用 small 模型与贪心解码，并在没有背景声时跳过人声分离；`balanced` 使用上面选择的模型；`accurate` 使用 large-v3 与束搜索。
             - **Hugging Face Token**: 必填项，用于从 Hugging Face Hub 下载模型。
         """)
         current_config = get_config()
@@ -308,6 +578,11 @@ def settings_page(restart_func):
                 label='Whisper 模型',
                 value=current_config.get('model_name', 'large-v3')
             ).classes('w-full').props('dark outlined')
+            profile_select = ui.select(
+                options=list(PIPELINE_PROFILES),
+                label='处理档位 (速度/质量)',
+                value=current_config.get('pipeline_profile', DEFAULT_PROFILE)
+            ).classes('w-full').props('dark outlined')
             hf_token_input = ui.input(
                 label='Hugging Face Token',
                 password=True, password_toggle_button=True,
@@ -320,12 +595,18 @@ def settings_page(restart_func):
             ).classes('w-full').props('dark outlined')
         def handle_save():
             new_config = {
+                **current_config,
                 'model_name': model_select.value,
+                'pipeline_profile': profile_select.value,
                 'hf_token': hf_token_input.value,
                 'hf_cache_dir': hf_cache_input.value.strip() or None,
             }
             save_config(new_config)
-            ui.notify('配置已保存！请重启应用以应用更改。', type='positive', duration=5000)
-            restart_func()
+            needs_restart = not hot_reload or any(new_config.get(k) != current_config.get(k) for k in RESTART_REQUIRED_KEYS)
+            if needs_restart:
+                ui.notify('配置已保存！请重启应用以应用更改。', type='positive', duration=5000)
+                restart_func()
+            else:
+                ui.notify('配置已保存！新提交的任务将使用新配置。', type='positive', duration=5000)
         with ui.row().classes('w-full justify-end mt-4'):
-            ui.button('保存并提示重启', on_click=handle_save, icon='save', color='primary')
\ No newline at end of file
+            ui.button('保存配置', on_click=handle_save, icon='save', color='primary')
\ No newline at end of file